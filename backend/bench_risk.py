@@ -0,0 +1,153 @@
+"""
+Micro-benchmark for RiskClassifier.
+
+    python bench_risk.py
+
+Compares the single-pass matcher against the previous
+one-regex-per-rule implementation on normal, long and adversarial
+messages, checks both agree, and shows how cost grows with the
+rule count.
+"""
+
+import re
+import time
+import random
+
+from services.risk_classifier import RiskClassifier
+
+
+# =====================================================
+# PREVIOUS IMPLEMENTATION (for comparison)
+# =====================================================
+LEGACY_HIGH_PATTERNS = [
+    r"\bchest pain\b",
+    r"\b(shortness of breath|difficulty breathing|can't breathe)\b",
+    r"\bloss of consciousness\b",
+    r"\bfainted?\b",
+    r"\bstroke\b",
+    r"\bface drooping\b",
+    r"\barm weakness\b",
+    r"\bsevere bleeding\b",
+    r"\buncontrolled bleeding\b",
+    r"\bheart attack\b",
+    r"\banaphylaxis\b",
+    r"\bchoking\b",
+    r"\bseizure\b",
+    r"\bsuicidal?\b",
+    r"\bwant to die\b",
+    r"\bcough(ing)? blood\b",
+    r"\bvomit(ing)? blood\b",
+]
+
+
+def legacy_classify(clf, text, high_patterns=LEGACY_HIGH_PATTERNS):
+    text_lower = text.lower()
+
+    for pattern in high_patterns:
+        if re.search(pattern, text_lower):
+            return "HIGH"
+
+    fever_match = re.search(r"fever.*?(\d+)\s*days?", text_lower)
+    if fever_match and int(fever_match.group(1)) > 3:
+        return "MEDIUM"
+
+    for keyword in clf.medium_risk_keywords:
+        if keyword in text_lower:
+            return "MEDIUM"
+
+    return "LOW"
+
+
+# =====================================================
+# INPUTS
+# =====================================================
+FILLER = (
+    "I have had a mild headache and some tiredness since the weekend, "
+    "mostly in the evenings after work. "
+)
+
+CASES = {
+    "short": "I have a runny nose and mild cough",
+    "short_high": "sudden chest pain going down my left arm",
+    "fever_days": "fever for 5 days and a sore throat",
+    "long_8k": FILLER * 80,
+    "long_high_at_end": FILLER * 80 + "now I have chest pain",
+    "fever_digits_30k": "fever " + "1" * 30000,
+    "fever_repeated": "fever " * 5000,
+    "fever_lines": ("fever " + "2" * 200 + "\n") * 200,
+}
+
+
+# made-up words for synthetic rules
+VOCAB = [
+    "".join(random.Random(i).choices("abcdefghijklmnopqrstuvwxyz", k=7))
+    for i in range(500)
+]
+
+
+def bench(fn, text, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(text)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    clf = RiskClassifier()
+
+    print(f"{'case':<20}{'chars':>8}{'legacy µs':>12}{'single µs':>12}  result")
+    for name, text in CASES.items():
+        repeat = 3 if len(text) > 5000 else 2000
+
+        expected = legacy_classify(clf, text)
+        got, rule = clf.classify_with_rule(text)
+        assert got == expected, (name, got, expected)
+
+        legacy = bench(lambda t: legacy_classify(clf, t), text, repeat)
+        single = bench(clf.classify_risk, text, repeat)
+
+        print(f"{name:<20}{len(text):>8}{legacy:>12.1f}{single:>12.1f}  {got} ({rule})")
+
+    # ---------------- agreement on random text ----------------
+    words = (
+        "fever days day 2 5 10 chest pain breath shortness of stroke "
+        "persistent severe pain high cough coughing blood vomit the and "
+        "fainted faint want to die seizure headache suicidal "
+        "persistently worsening\n"
+    ).split(" ")
+    rng = random.Random(0)
+
+    samples = [
+        " ".join(rng.choice(words) for _ in range(rng.randint(1, 40)))
+        for _ in range(5000)
+    ]
+    mismatches = sum(
+        clf.classify_risk(s) != legacy_classify(clf, s) for s in samples
+    )
+    print(f"\nrandom agreement: {len(samples) - mismatches}/{len(samples)}")
+
+    start = time.perf_counter()
+    clf.classify_many(samples)
+    print(f"classify_many: {(time.perf_counter() - start) / len(samples) * 1e6:.1f} µs/message")
+
+    # ---------------- scaling with rule count ----------------
+    print(f"\n{'rules':>6}{'legacy µs':>12}{'single µs':>12}   (long_8k, LOW)")
+    text = CASES["long_8k"]
+
+    for extra in (0, 100, 300, 1000):
+        big = RiskClassifier()
+        patterns = list(LEGACY_HIGH_PATTERNS)
+
+        for i in range(extra):
+            phrase = f"{rng.choice(VOCAB)} {rng.choice(VOCAB)}"
+            big.high_risk_phrases[f"synthetic_{i}"] = [phrase]
+            patterns.append(rf"\b{phrase}\b")
+        big.compile()
+
+        legacy = bench(lambda t: legacy_classify(big, t, patterns), text, 3)
+        single = bench(big.classify_risk, text, 3)
+        print(f"{len(patterns):>6}{legacy:>12.1f}{single:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Memory benchmark for live sessions.
+
+    python bench_sessions.py [sessions]
+
+Builds the same conversations (default 100k) as the previous
+dict-of-lists sessions and as Session objects, and reports the
+memory each takes (tracemalloc) plus history append cost once
+the history is full.
+"""
+
+import sys
+import time
+import gc
+import tracemalloc
+
+from services.session import DiagnosticState, Session
+
+MESSAGES = [
+    "I have had a headache and a mild fever for two days now",
+    "How long have you had these symptoms?",
+    "Since Monday, it gets worse in the evening",
+    "Do you have any nausea or sensitivity to light?",
+    "Yes, bright light bothers me a bit",
+    "Have you noticed any stiffness in your neck?",
+]
+QUESTIONS = [
+    "Does the pain get worse when you bend forward?",
+    "Have you had a runny or blocked nose?",
+]
+DISEASES = ["Migraine", "Tension Headache", "Sinusitis"]
+
+
+# =====================================================
+# BUILDERS
+# =====================================================
+def legacy_session(i):
+    now = time.time()
+    return {
+        "history": [
+            {"role": "user" if n % 2 == 0 else "model", "parts": [f"{text} #{i}"]}
+            for n, text in enumerate(MESSAGES)
+        ],
+        "created_at": now,
+        "last_accessed": now,
+        "pending_questions": list(QUESTIONS),
+        "collected_answers": [],
+        "candidate_diseases": list(DISEASES),
+        "diagnostic_state": "CLARIFYING",
+        "status": "ACTIVE",
+    }
+
+
+def compact_session(i):
+    session = Session()
+    for n, text in enumerate(MESSAGES):
+        session.add_message("user" if n % 2 == 0 else "model", f"{text} #{i}")
+    session.set_pending(QUESTIONS)
+    session.candidate_diseases = list(DISEASES)
+    session.diagnostic_state = DiagnosticState.CLARIFYING
+    return session
+
+
+def measure(build, count):
+    gc.collect()
+    tracemalloc.start()
+
+    sessions = {f"{i:032x}": build(i) for i in range(count)}
+
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return sessions, current
+
+
+# =====================================================
+# HISTORY APPEND AT THE LIMIT
+# =====================================================
+def append_cost(repeat=200_000):
+    history = [{"role": "user", "parts": ["x"]} for _ in range(20)]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        history.append({"role": "user", "parts": ["x"]})
+        if len(history) > 20:
+            history.pop(0)
+    legacy = (time.perf_counter() - start) / repeat * 1e9
+
+    session = Session()
+    for _ in range(20):
+        session.add_message("user", "x")
+    start = time.perf_counter()
+    for _ in range(repeat):
+        session.add_message("user", "x")
+    compact = (time.perf_counter() - start) / repeat * 1e9
+
+    return legacy, compact
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+    # message text is the same in both, so the difference is overhead
+    legacy, legacy_bytes = measure(legacy_session, count)
+    del legacy
+    compact, compact_bytes = measure(compact_session, count)
+    del compact
+
+    print(f"{count} sessions, {len(MESSAGES)} messages each")
+    print(f"  dict sessions:    {legacy_bytes / 2**20:8.1f} MiB  ({legacy_bytes / count:.0f} B/session)")
+    print(f"  Session objects:  {compact_bytes / 2**20:8.1f} MiB  ({compact_bytes / count:.0f} B/session)")
+    print(f"  saved:            {(1 - compact_bytes / legacy_bytes) * 100:.0f}%")
+
+    legacy_ns, compact_ns = append_cost()
+    print(f"\nhistory append at limit: dict entry {legacy_ns:.0f} ns, Session.add_message {compact_ns:.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Offline batch job: precompute clarifying questions for every KB
+disease and for the disease pairs / triples that are likely to
+show up together as candidates.
+
+    python build_question_bank.py [--concurrency 8] [--limit 50]
+
+Candidate sets are each disease plus its nearest KB neighbours
+(by TF-IDF similarity of its first passage). Results go to
+QUESTION_BANK_PATH (default question_bank.json.gz); entries that
+are already in the file are kept, so an interrupted run resumes.
+"""
+
+import asyncio
+import argparse
+
+from services.rag_engine import RAGEngine
+from services.diagnosis_service import DiagnosisService
+from services.question_bank import QuestionBank, QUESTION_BANK_PATH
+
+# loose on purpose: any related disease is a plausible co-candidate
+NEIGHBOUR_THRESHOLD = 1.6
+SAVE_EVERY = 50
+SYMPTOMS_PLACEHOLDER = "Not provided (questions are reused for any patient)"
+
+
+# =====================================================
+# CANDIDATE SETS
+# =====================================================
+def candidate_sets(engine, neighbours: int, triples: bool) -> list:
+    """Title lists: singles, then (disease, neighbour) pairs and triples"""
+    sets = []
+    seen = set()
+
+    def add(titles):
+        key = QuestionBank.make_key(titles)
+        if key not in seen:
+            seen.add(key)
+            sets.append(sorted(titles))
+
+    for record in engine.records.values():
+        doc_id = record["doc_ids"][0]
+        title = engine.doc_title(doc_id)
+        add([title])
+
+        nearest = [
+            name
+            for name, _ in engine.candidate_diseases(
+                engine.documents[doc_id],
+                limit=neighbours + 1,
+                threshold=NEIGHBOUR_THRESHOLD
+            )
+            if name != title
+        ][:neighbours]
+
+        for name in nearest:
+            add([title, name])
+
+        if triples and len(nearest) >= 2:
+            add([title, nearest[0], nearest[1]])
+
+    return sets
+
+
+# =====================================================
+# BUILD
+# =====================================================
+async def build(args):
+    engine = RAGEngine(args.kb)
+    diagnosis = DiagnosisService(engine)
+
+    bank = QuestionBank.load(engine, args.out)
+    bank.source_sha256 = engine.source_hash
+
+    sets = candidate_sets(engine, args.neighbours, not args.no_triples)
+    todo = [s for s in sets if QuestionBank.make_key(s) not in bank.entries]
+    if args.limit:
+        todo = todo[:args.limit]
+
+    print(f"{len(sets)} candidate sets, {len(todo)} to generate")
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    done = 0
+    failed = 0
+
+    async def generate(titles):
+        nonlocal done, failed
+
+        async with semaphore:
+            try:
+                questions = await diagnosis.request_clarifying_questions(
+                    titles,
+                    SYMPTOMS_PLACEHOLDER
+                )
+            except Exception as e:
+                failed += 1
+                print(f"Failed {titles}: {e}")
+                return
+
+        if len(questions) < 4:
+            failed += 1
+            return
+
+        bank.entries[QuestionBank.make_key(titles)] = questions
+        done += 1
+
+        if done % SAVE_EVERY == 0:
+            bank.save(args.out)
+            print(f"{done}/{len(todo)} generated")
+
+    await asyncio.gather(*(generate(titles) for titles in todo))
+
+    bank.save(args.out)
+    print(f"Saved {len(bank)} entries to {args.out} ({failed} failed)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--kb", default="medical_clean.json")
+    parser.add_argument("--out", default=QUESTION_BANK_PATH)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--neighbours", type=int, default=2)
+    parser.add_argument("--no-triples", action="store_true")
+    parser.add_argument("--limit", type=int, default=0)
+
+    asyncio.run(build(parser.parse_args()))
@@ -1,13 +1,26 @@
-from fastapi import FastAPI
+import os
+import json
+import hmac
+import asyncio
+from typing import Optional
+
+from fastapi import FastAPI, Header, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from models import ChatRequest, ChatResponse
 
-from services.session_manager import SessionManager
+from services.session_manager import SessionBusy, SessionManager
+from services.session_store import create_session_store
+from services.llm_gateway import gateway
 from services.llm_service import LLMService
 from services.risk_classifier import RiskClassifier
-from services.query_analyzer import QueryAnalyzer
-from services.rag_engine import RAGEngine
+from services.query_analyzer import COMBINED_KB_CANDIDATES, QueryAnalyzer, local_intent
+from services.rag_reloader import ReloadableRAGEngine
 from services.diagnosis_service import DiagnosisService
+from services.question_bank import QuestionBank
+from services.stage_timer import StageTimer
+from services.concurrency import Broadcast, KeyedLocks, SingleFlight
+from services.deadline import ANALYSIS_SHARE, STREAM_BUDGET, TURN_BUDGET, Deadline
 
 # =====================================================
 # APP SETUP
@@ -27,12 +40,44 @@ app.add_middleware(
 # SERVICES INITIALIZATION
 # =====================================================
 
-session_manager = SessionManager()
+session_manager = SessionManager(store=create_session_store())
 llm_service = LLMService()
 risk_classifier = RiskClassifier()
-query_analyzer = QueryAnalyzer()
-rag_engine = RAGEngine("medical_clean.json")
-diagnosis_service = DiagnosisService(rag_engine)
+rag_engine = ReloadableRAGEngine("medical_clean.json")
+query_analyzer = QueryAnalyzer(rag_engine=rag_engine)
+question_bank = QuestionBank.load(rag_engine)
+diagnosis_service = DiagnosisService(rag_engine, question_bank=question_bank)
+
+# one turn at a time per session; identical in-flight requests share one turn
+turn_locks = KeyedLocks()
+turn_flights = SingleFlight()
+
+# fire-and-forget tasks, referenced until they finish
+background_tasks = set()
+
+
+@app.exception_handler(SessionBusy)
+async def session_busy_handler(request: Request, exc: SessionBusy):
+    # another worker is still running a turn on this session
+    return JSONResponse(
+        status_code=409,
+        content={"detail": "This session is busy with another message. Try again shortly."},
+    )
+
+
+@app.on_event("startup")
+async def start_session_sweeper():
+    session_manager.start_sweeper()
+
+
+@app.on_event("shutdown")
+async def stop_session_sweeper():
+    await session_manager.stop_sweeper()
+
+
+@app.on_event("shutdown")
+async def close_llm_gateway():
+    await gateway.aclose()
 
 
 # =====================================================
@@ -67,43 +112,199 @@ def is_topic_shift(user_message: str, has_pending: bool) -> bool:
 
 
 # =====================================================
-# CHAT ENDPOINT
+# TURN PIPELINE
 # =====================================================
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(request: ChatRequest):
+def discard(task: Optional[asyncio.Task]):
+    """Drop a speculative task whose result turned out unneeded"""
+    if task is None:
+        return
 
-    session_id = request.session_id
+    task.cancel()
+    # retrieve any exception so it isn't logged as unhandled
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
 
-    # ---------------- CREATE SESSION ----------------
-    if not session_id:
-        session_id = session_manager.create_session()
 
-    session = session_manager.get_session(session_id)
-    if not session:
-        session_id = session_manager.create_session()
-        session = session_manager.get_session(session_id)
+async def process_turn(
+    request: ChatRequest,
+    stream: bool = False,
+    timer: Optional[StageTimer] = None
+):
+    """
+    Run one chat turn and return (session_id, reply).
 
-    user_message = request.message
+    reply is the bot text, already stored in the session. With
+    stream=True the LLM-generated stages (final diagnosis, RAG
+    answer) instead return a Broadcast of text chunks, which
+    stores the joined text once the stream ends.
 
-    # store message
-    session_manager.add_message(session_id, "user", user_message)
+    Turns on the same session run one at a time; a streamed
+    reply keeps the session locked until it has been stored.
+
+    Emergencies on an existing session are answered before
+    waiting for its lock; the message is recorded afterwards.
+
+    Per-stage durations are recorded on `timer`. LLM stages
+    share a TURN_BUDGET deadline and fall back to canned or
+    KB-only text when it runs out.
+    """
+
+    timer = timer or StageTimer()
 
     # =====================================================
-    # RISK CHECK
+    # RISK CHECK (never queues behind another turn)
     # =====================================================
-    risk_level = risk_classifier.classify_risk(user_message)
+    with timer.stage("risk"):
+        risk_level = risk_classifier.classify_risk(request.message)
     print(f"Detected Risk Level: {risk_level}")
 
+    if risk_level == "HIGH" and request.session_id:
+        bot_response_text = risk_classifier.get_emergency_response()
+
+        task = asyncio.create_task(record_emergency(
+            request.session_id, request.message, bot_response_text
+        ))
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+        return request.session_id, bot_response_text
+
+    session_id, scope = await open_turn(request.session_id)
+
+    # the LLM budget starts once the session is ours, so waiting
+    # for another turn's lock or lease does not eat into it
+    budget = Deadline(TURN_BUDGET)
+
+    async def close_turn():
+        try:
+            await session_manager.close_scope(scope)
+        finally:
+            turn_locks.release(session_id)
+
+    try:
+        with session_manager.in_scope(scope):
+            reply = await run_turn(
+                session_id, request.message, risk_level, stream, timer, budget
+            )
+    except BaseException:
+        await close_turn()
+        raise
+
+    if isinstance(reply, str):
+        await close_turn()
+        return session_id, reply
+
+    async def store_reply(text: str):
+        # runs once generation ends, is cut off by STREAM_BUDGET or
+        # loses its last reader; the lease and lock are held until
+        # the (possibly partial) reply is stored
+        try:
+            if text.strip():
+                with session_manager.in_scope(scope):
+                    session_manager.add_message(session_id, "model", text.strip())
+        finally:
+            await close_turn()
+
+    return session_id, Broadcast(
+        reply,
+        on_done=store_reply,
+        deadline=Deadline(STREAM_BUDGET)
+    )
+
+
+async def record_emergency(session_id: str, user_message: str, reply: str):
+    """Store an already answered emergency turn and lock the session"""
+    try:
+        session_id, scope = await open_turn(session_id)
+    except SessionBusy:
+        print(f"Emergency on busy session {session_id} not recorded")
+        return
+
+    try:
+        with session_manager.in_scope(scope):
+            session_manager.add_message(session_id, "user", user_message)
+            session_manager.lock_emergency(session_id)
+            session_manager.add_message(session_id, "model", reply)
+    finally:
+        try:
+            await session_manager.close_scope(scope)
+        finally:
+            turn_locks.release(session_id)
+
+
+async def open_turn(session_id: Optional[str]):
+    """
+    Lock the session in this worker, then lease and load it
+    (one lease + one batched write for the whole turn).
+    Returns (session_id, scope); a missing or ended session is
+    swapped for a new one.
+    """
+
+    if session_id:
+        await turn_locks.acquire(session_id)
+
+    try:
+        scope = await session_manager.open_scope(session_id)
+    except BaseException:
+        if session_id:
+            turn_locks.release(session_id)
+        raise
+
+    if scope["session_id"] != session_id:
+        if session_id:
+            turn_locks.release(session_id)
+        session_id = scope["session_id"]
+        # a fresh id: nobody else can be waiting on it
+        await turn_locks.acquire(session_id)
+
+    return session_id, scope
+
+
+async def process_turn_once(
+    request: ChatRequest,
+    stream: bool = False,
+    timer: Optional[StageTimer] = None
+):
+    """
+    process_turn, deduplicated: a request identical to one still
+    in flight (same session, same message — e.g. a double submit
+    or client retry) shares its result instead of running again.
+    """
+
+    if not request.session_id:
+        return await process_turn(request, stream, timer)
+
+    key = (request.session_id, request.message.strip())
+
+    return await turn_flights.run(
+        key,
+        lambda: process_turn(request, stream, timer),
+        until=lambda result: (
+            result[1].finished if isinstance(result[1], Broadcast) else None
+        )
+    )
+
+
+async def run_turn(
+    session_id: str,
+    user_message: str,
+    risk_level: str,
+    stream: bool,
+    timer: StageTimer,
+    budget: Deadline
+):
+    """Body of process_turn, inside the session's scope"""
+
+    # store message
+    session_manager.add_message(session_id, "user", user_message)
+
+    # emergency on a new session (existing ones answer before locking)
     if risk_level == "HIGH":
         bot_response_text = risk_classifier.get_emergency_response()
         session_manager.lock_emergency(session_id)
         session_manager.add_message(session_id, "model", bot_response_text)
 
-        return ChatResponse(
-            response=bot_response_text,
-            session_id=session_id
-        )
+        return bot_response_text
 
     # =====================================================
     # FOLLOWUP MODE + TOPIC SHIFT
@@ -131,7 +332,7 @@ async def chat_endpoint(request: ChatRequest):
         next_q = session_manager.get_next_question(session_id)
         if next_q:
             session_manager.add_message(session_id, "model", next_q)
-            return ChatResponse(response=next_q, session_id=session_id)
+            return next_q
 
         # transition state
         if state == "CLARIFYING":
@@ -149,17 +350,23 @@ async def chat_endpoint(request: ChatRequest):
         history = session_manager.get_history(session_id)
         diseases = session_manager.get_candidate_diseases(session_id)
 
-        bot_response_text = await diagnosis_service.get_final_diagnosis(
-            diseases,
-            history
-        )
+        if stream:
+            return diagnosis_service.stream_final_diagnosis(
+                diseases,
+                history,
+                deadline=budget
+            )
+
+        with timer.stage("final"):
+            bot_response_text = await diagnosis_service.get_final_diagnosis(
+                diseases,
+                history,
+                deadline=budget
+            )
 
         session_manager.add_message(session_id, "model", bot_response_text)
 
-        return ChatResponse(
-            response=bot_response_text,
-            session_id=session_id
-        )
+        return bot_response_text
 
     # =====================================================
     # ANALYSIS PHASE
@@ -171,7 +378,32 @@ async def chat_endpoint(request: ChatRequest):
         for m in history[-4:]
     ]
 
-    analysis = await query_analyzer.analyze(user_message, history_text)
+    # Speculative KB retrieval: one scoring pass gives the RAG
+    # answer context and the combined analyzer's KB candidates.
+    # Without combined mode it overlaps the analyzer call; only the
+    # RAG answer branch uses it then, other branches discard it.
+    # Skipped when the analyzer will answer locally anyway.
+    rag_task = None
+    candidates = None
+    if local_intent(user_message) is None:
+        rag_task = asyncio.create_task(asyncio.to_thread(
+            timer.timed("rag", rag_engine.retrieve),
+            user_message,
+            COMBINED_KB_CANDIDATES
+        ))
+
+        if query_analyzer.combined:
+            with timer.stage("rag_wait"):
+                _, candidates = await rag_task
+
+    with timer.stage("analyze"):
+        # leave time for the clarifying-question / answer stage
+        analysis = await query_analyzer.analyze(
+            user_message,
+            history_text,
+            deadline=budget.share(ANALYSIS_SHARE),
+            candidates=candidates
+        )
     print(f"Query Analysis: {analysis}")
 
     intent = analysis.get("intent", "MEDICAL")
@@ -180,6 +412,12 @@ async def chat_endpoint(request: ChatRequest):
     potential_diseases = analysis.get("potential_diseases", [])
 
     # ---------------- NON MEDICAL ----------------
+    if intent != "MEDICAL" or potential_diseases or (
+        completeness == "VAGUE" and followups
+    ):
+        discard(rag_task)
+        rag_task = None
+
     if intent == "NON_MEDICAL":
         bot_response_text = (
             "I am a healthcare assistant and can only help with medical queries."
@@ -208,10 +446,15 @@ async def chat_endpoint(request: ChatRequest):
                 "CLARIFYING"
             )
 
-            clarifying_qs = await diagnosis_service.generate_clarifying_questions(
-                potential_diseases,
-                user_message
-            )
+            # banked questions first, then the ones combined
+            # analyzer mode already wrote, then a separate LLM call
+            with timer.stage("clarify"):
+                clarifying_qs = await diagnosis_service.generate_clarifying_questions(
+                    potential_diseases,
+                    user_message,
+                    deadline=budget,
+                    drafted=analysis.get("clarifying_questions")
+                )
 
             session_manager.set_followups(session_id, clarifying_qs[:4])
 
@@ -228,14 +471,32 @@ async def chat_endpoint(request: ChatRequest):
 
         # RAG + self reasoning fallback
         else:
-            context = rag_engine.search(user_message)
-
-            bot_response_text = await llm_service.generate_response(
-                history[:-1],
-                user_message,
-                context=context if context else "",
-                mode="NORMAL"
-            )
+            if rag_task is not None:
+                with timer.stage("rag_wait"):
+                    context, _ = await rag_task
+            else:
+                context = await asyncio.to_thread(
+                    timer.timed("rag", rag_engine.search),
+                    user_message
+                )
+
+            if stream:
+                return llm_service.stream_response(
+                    history[:-1],
+                    user_message,
+                    context=context if context else "",
+                    mode="NORMAL",
+                    deadline=budget
+                )
+
+            with timer.stage("llm"):
+                bot_response_text = await llm_service.generate_response(
+                    history[:-1],
+                    user_message,
+                    context=context if context else "",
+                    mode="NORMAL",
+                    deadline=budget
+                )
 
     # ---------------- UNKNOWN ----------------
     else:
@@ -246,12 +507,149 @@ async def chat_endpoint(request: ChatRequest):
     # store bot reply
     session_manager.add_message(session_id, "model", bot_response_text)
 
+    return bot_response_text
+
+
+# =====================================================
+# CHAT ENDPOINT
+# =====================================================
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat_endpoint(request: ChatRequest, response: Response):
+
+    timer = StageTimer()
+    session_id, bot_response_text = await process_turn_once(request, timer=timer)
+
+    # shared with a concurrent streamed request
+    if isinstance(bot_response_text, Broadcast):
+        bot_response_text = (await bot_response_text.text()).strip()
+
+    print(f"Turn timing: {timer.summary()}")
+    response.headers["Server-Timing"] = timer.server_timing()
+
     return ChatResponse(
         response=bot_response_text,
         session_id=session_id
     )
 
 
+# =====================================================
+# STREAMING CHAT ENDPOINT (SSE)
+# =====================================================
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """
+    Same turn as /chat, delivered as Server-Sent Events:
+    session → token* → done.
+    """
+
+    timer = StageTimer()
+    session_id, reply = await process_turn_once(request, stream=True, timer=timer)
+
+    # header goes out before the first token, so it covers setup only
+    setup_timing = timer.server_timing()
+
+    async def events():
+        yield sse_event("session", {"session_id": session_id})
+
+        # canned / already stored reply → single token event
+        if isinstance(reply, str):
+            print(f"Turn timing: {timer.summary()}")
+            yield sse_event("token", {"text": reply})
+            yield sse_event("done", {"session_id": session_id})
+            return
+
+        # the Broadcast stores the full reply itself when it ends;
+        # closing our subscription promptly lets a reply nobody is
+        # reading any more stop early
+        chunks = reply.subscribe()
+        try:
+            with timer.stage("stream"):
+                async for chunk in chunks:
+                    yield sse_event("token", {"text": chunk})
+
+            yield sse_event("done", {"session_id": session_id})
+
+        finally:
+            await chunks.aclose()
+            print(f"Turn timing: {timer.summary()}")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            "Server-Timing": setup_timing,
+        },
+    )
+
+
+# =====================================================
+# ADMIN: INDEX HOT RELOAD
+# =====================================================
+
+# admin endpoints stay closed until ADMIN_TOKEN is set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+def check_admin(token: Optional[str]):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled")
+
+    if not token or not hmac.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@app.get("/admin/index")
+async def index_status(x_admin_token: Optional[str] = Header(None)):
+    check_admin(x_admin_token)
+    return rag_engine.status()
+
+
+@app.post("/admin/index/reload")
+async def reload_index(x_admin_token: Optional[str] = Header(None)):
+    """
+    Rebuild the RAG index in the background and swap it in.
+    Requests keep using the active version until the swap.
+    """
+    check_admin(x_admin_token)
+
+    started = rag_engine.start_reload()
+
+    return {
+        "reload_started": started,
+        **rag_engine.status()
+    }
+
+
+@app.get("/admin/llm")
+async def llm_status(x_admin_token: Optional[str] = Header(None)):
+    check_admin(x_admin_token)
+    return {
+        "gateway": gateway.stats(),
+        "response_cache": llm_service.cache.stats(),
+        "query_analyzer": query_analyzer.get_stats(),
+        "question_bank": question_bank.stats(),
+    }
+
+
+@app.get("/admin/sessions")
+async def sessions_status(x_admin_token: Optional[str] = Header(None)):
+    check_admin(x_admin_token)
+    return {
+        **session_manager.stats(),
+        "turn_locks": len(turn_locks),
+        "turn_lock_contended": turn_locks.contended,
+        "single_flight": turn_flights.stats(),
+    }
+
+
 # =====================================================
 # RUN SERVER (WORKS WITH python main.py)
 # =====================================================
@@ -0,0 +1,150 @@
+import os
+import time
+from enum import Enum
+from collections import deque
+
+
+# ---------------- CONFIG ----------------
+# open once at least BREAKER_MIN_CALLS of the last BREAKER_WINDOW
+# calls were made and BREAKER_ERROR_RATE of them failed
+BREAKER_WINDOW = int(os.getenv("LLM_BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "10"))
+BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))
+
+# seconds to stay open before letting probe calls through
+BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+# concurrent probes while half-open; this many successes close it
+HALF_OPEN_PROBES = 2
+
+
+class BreakerState(str, Enum):
+    CLOSED = "CLOSED"
+    OPEN = "OPEN"
+    HALF_OPEN = "HALF_OPEN"
+
+
+class CircuitOpen(Exception):
+    """The provider is failing; the call was not attempted"""
+
+
+# =====================================================
+# CIRCUIT BREAKER
+# =====================================================
+class CircuitBreaker:
+    """
+    Stops calling a failing provider.
+
+    CLOSED: calls go through and their outcomes are tracked.
+    OPEN: calls fail at once with CircuitOpen for the cooldown.
+    HALF_OPEN: a few probe calls go through; enough successes
+    close the breaker, any failure opens it again.
+    """
+
+    def __init__(
+        self,
+        window: int = BREAKER_WINDOW,
+        min_calls: int = BREAKER_MIN_CALLS,
+        error_rate: float = BREAKER_ERROR_RATE,
+        cooldown: float = BREAKER_COOLDOWN
+    ):
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+
+        self.state = BreakerState.CLOSED
+        self.outcomes = deque(maxlen=window)  # True = failure
+        self.opened_at = 0.0
+
+        self.probes = 0
+        self.probe_successes = 0
+
+        # metrics
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def rejecting(self) -> bool:
+        """Whether a call made now would get CircuitOpen"""
+        if self.state is BreakerState.OPEN:
+            return time.monotonic() - self.opened_at < self.cooldown
+        if self.state is BreakerState.HALF_OPEN:
+            return self.probes >= HALF_OPEN_PROBES
+        return False
+
+    def before_call(self) -> bool:
+        """
+        Admit a call or raise CircuitOpen. Returns True when the
+        call is a half-open probe (pass it back to the record
+        methods).
+        """
+        if self.state is BreakerState.OPEN:
+            if time.monotonic() - self.opened_at < self.cooldown:
+                self.rejected += 1
+                raise CircuitOpen("LLM provider unavailable (circuit open)")
+
+            self.state = BreakerState.HALF_OPEN
+            self.probes = 0
+            self.probe_successes = 0
+
+        if self.state is BreakerState.HALF_OPEN:
+            if self.probes >= HALF_OPEN_PROBES:
+                self.rejected += 1
+                raise CircuitOpen("LLM provider unavailable (probing)")
+
+            self.probes += 1
+            return True
+
+        return False
+
+    def record_success(self, probe: bool = False):
+        if probe:
+            self.probes = max(0, self.probes - 1)
+            if self.state is BreakerState.HALF_OPEN:
+                self.probe_successes += 1
+                if self.probe_successes >= HALF_OPEN_PROBES:
+                    self._close()
+            return
+
+        self.outcomes.append(False)
+
+    def record_failure(self, probe: bool = False):
+        if probe:
+            self.probes = max(0, self.probes - 1)
+            if self.state is BreakerState.HALF_OPEN:
+                self._open()
+            return
+
+        self.outcomes.append(True)
+
+        if (
+            self.state is BreakerState.CLOSED
+            and len(self.outcomes) >= self.min_calls
+            and sum(self.outcomes) / len(self.outcomes) >= self.error_rate
+        ):
+            self._open()
+
+    def record_abandoned(self, probe: bool = False):
+        """Call cancelled before an outcome (e.g. a lost hedge)"""
+        if probe:
+            self.probes = max(0, self.probes - 1)
+
+    def _open(self):
+        print(f"LLM circuit breaker OPEN for {self.cooldown:g}s")
+        self.state = BreakerState.OPEN
+        self.opened_at = time.monotonic()
+        self.opened += 1
+
+    def _close(self):
+        print("LLM circuit breaker CLOSED")
+        self.state = BreakerState.CLOSED
+        self.outcomes.clear()
+
+    def stats(self) -> dict:
+        failures = sum(self.outcomes)
+        return {
+            "state": self.state.value,
+            "error_rate": round(failures / len(self.outcomes), 3) if self.outcomes else 0.0,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,231 @@
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from services.deadline import Deadline, within
+
+
+# =====================================================
+# KEYED LOCKS
+# =====================================================
+class KeyedLocks:
+    """
+    One asyncio.Lock per key (e.g. session id), created on first
+    use and dropped once nobody holds or waits for it, so idle
+    keys cost nothing.
+
+    acquire()/release() may happen in different tasks, which lets
+    a streamed reply keep its session locked until it finishes.
+    """
+
+    def __init__(self):
+        # key → [lock, holders + waiters]
+        self._locks: Dict[Hashable, list] = {}
+        self.contended = 0
+
+    def __len__(self):
+        return len(self._locks)
+
+    async def acquire(self, key: Hashable):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+
+        entry[1] += 1
+        if entry[0].locked():
+            self.contended += 1
+
+        try:
+            await entry[0].acquire()
+        except BaseException:
+            self._unref(key, entry)
+            raise
+
+    def release(self, key: Hashable):
+        entry = self._locks[key]
+        entry[0].release()
+        self._unref(key, entry)
+
+    def _unref(self, key: Hashable, entry: list):
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._locks[key]
+
+
+# =====================================================
+# SINGLE FLIGHT
+# =====================================================
+class SingleFlight:
+    """
+    Collapse identical concurrent calls into one.
+
+    The first caller for a key starts the work as a task; callers
+    arriving while it runs await the same task. The task is
+    shielded, so a leader that disconnects does not cancel the
+    work its followers are waiting on.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.shared = 0
+
+    def __len__(self):
+        return len(self._calls)
+
+    async def run(
+        self,
+        key: Hashable,
+        fn: Callable[[], Awaitable],
+        until: Optional[Callable[[object], Optional[Awaitable]]] = None
+    ):
+        """
+        Result of fn(), shared with concurrent calls for `key`.
+
+        `until(result)` may return an awaitable; the key keeps
+        serving the same result until it completes (e.g. while a
+        streamed reply is still being generated).
+        """
+
+        task = self._calls.get(key)
+
+        if task is not None:
+            self.shared += 1
+            return await asyncio.shield(task)
+
+        self.leaders += 1
+        task = asyncio.create_task(self._call(key, fn, until))
+        self._calls[key] = task
+
+        # retrieve the error even if every caller has gone away
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+        return await asyncio.shield(task)
+
+    async def _call(self, key, fn, until):
+        try:
+            result = await fn()
+        except BaseException:
+            self._calls.pop(key, None)
+            raise
+
+        linger = until(result) if until else None
+        if linger is None:
+            self._calls.pop(key, None)
+        else:
+            asyncio.ensure_future(linger).add_done_callback(
+                lambda _: self._calls.pop(key, None)
+            )
+
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "shared": self.shared,
+        }
+
+
+# =====================================================
+# BROADCAST STREAM
+# =====================================================
+class Broadcast:
+    """
+    Fan one async text stream out to any number of readers.
+
+    A background task drains the source, so generation continues
+    while readers come and go. Late readers replay the chunks
+    produced so far.
+
+    Generation stops early when `deadline` passes or when the
+    last reader leaves; on_done then gets the text produced so
+    far. `finished` only resolves once on_done has been awaited.
+    """
+
+    def __init__(
+        self,
+        source: AsyncIterator[str],
+        on_done: Optional[Callable[[str], Awaitable[None]]] = None,
+        deadline: Optional[Deadline] = None
+    ):
+        self.chunks: List[str] = []
+        self.done = False
+        self.readers = 0
+        self.abandoned = False
+
+        self._changed = asyncio.Condition()
+        self._on_done = on_done
+        self._generation = asyncio.create_task(self._drain(source))
+        self.finished = asyncio.create_task(self._pump(deadline))
+
+    async def _drain(self, source: AsyncIterator[str]):
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                async with self._changed:
+                    self._changed.notify_all()
+
+        except Exception as e:
+            print(f"Reply stream failed: {e}")
+
+        finally:
+            if hasattr(source, "aclose"):
+                await source.aclose()
+
+    async def _pump(self, deadline: Optional[Deadline]) -> str:
+        try:
+            await within(deadline, self._generation)
+
+        except asyncio.TimeoutError:
+            print("Reply stream stopped at its deadline")
+
+        except asyncio.CancelledError:
+            if not self.abandoned:
+                raise
+            print("Reply stream stopped: every reader left")
+
+        finally:
+            self.done = True
+            async with self._changed:
+                self._changed.notify_all()
+
+            text = "".join(self.chunks)
+            if self._on_done:
+                await self._on_done(text)
+
+        return text
+
+    def _leave(self):
+        self.readers -= 1
+        if self.readers == 0 and not self.done:
+            self.abandoned = True
+            self._generation.cancel()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        """Chunks as they arrive; close it when the reader goes away"""
+        sent = 0
+        self.readers += 1
+
+        try:
+            while True:
+                while sent < len(self.chunks):
+                    yield self.chunks[sent]
+                    sent += 1
+
+                if self.done:
+                    return
+
+                async with self._changed:
+                    await self._changed.wait_for(
+                        lambda: self.done or len(self.chunks) > sent
+                    )
+
+        finally:
+            self._leave()
+
+    async def text(self) -> str:
+        self.readers += 1
+        try:
+            return await asyncio.shield(self.finished)
+        finally:
+            self._leave()
@@ -0,0 +1,60 @@
+import os
+import time
+import asyncio
+from typing import Awaitable, Optional
+
+
+# ---------------- CONFIG ----------------
+# worst-case seconds for one chat turn, LLM calls included
+TURN_BUDGET = float(os.getenv("TURN_BUDGET", "20"))
+
+# fraction of the remaining budget the analyzer may use when
+# another LLM stage (clarifying questions / answer) may follow
+ANALYSIS_SHARE = float(os.getenv("TURN_ANALYSIS_SHARE", "0.4"))
+
+# worst-case seconds a streamed reply keeps generating (and keeps
+# its session locked) once the turn has handed it off
+STREAM_BUDGET = float(os.getenv("STREAM_BUDGET", "60"))
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """The caller's own time budget ran out (not a provider timeout)"""
+
+
+# =====================================================
+# DEADLINE
+# =====================================================
+class Deadline:
+    """
+    The time.monotonic() instant by which a turn (or one stage
+    of it) has to be done.
+    """
+
+    def __init__(self, seconds: float):
+        self.at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.at
+
+    def share(self, fraction: float) -> "Deadline":
+        """Deadline for a stage given `fraction` of the time left"""
+        return Deadline(self.remaining() * fraction)
+
+
+async def within(deadline: Optional[Deadline], awaitable: Awaitable):
+    """
+    Await `awaitable`, cancelling it with DeadlineExceeded (an
+    asyncio.TimeoutError) once `deadline` passes (no limit when
+    deadline is None).
+    """
+    if deadline is None:
+        return await awaitable
+
+    try:
+        return await asyncio.wait_for(awaitable, deadline.remaining())
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded("deadline passed") from None
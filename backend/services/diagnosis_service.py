@@ -1,56 +1,121 @@
-import os
 import json
 import asyncio
-from google import genai
-from dotenv import load_dotenv
+from typing import AsyncIterator, Optional
 
-load_dotenv()
+from services.deadline import Deadline
+from services.llm_gateway import LLMGateway, gateway as default_gateway
+from services.llm_scheduler import Priority
+from services.question_bank import QuestionBank
 
-# ---------------- CONFIG ----------------
-API_KEY = os.getenv("GOOGLE_API_KEY")
-if not API_KEY:
-    raise ValueError("GOOGLE_API_KEY missing")
-
-client = genai.Client(api_key=API_KEY)
+FINAL_DIAGNOSIS_FALLBACK = (
+    "Based on your symptoms, it is difficult to be certain. "
+    "Please consult a healthcare professional for a formal diagnosis."
+)
 
 
 # =====================================================
 # DIAGNOSIS SERVICE
 # =====================================================
 class DiagnosisService:
-    def __init__(self, rag_engine):
+    def __init__(
+        self,
+        rag_engine,
+        gateway: Optional[LLMGateway] = None,
+        question_bank: Optional[QuestionBank] = None
+    ):
         self.rag_engine = rag_engine
+        self.gateway = gateway or default_gateway
+        self.question_bank = question_bank
 
     # -------------------------------------------------
-    # Generate Clarifying Questions
+    # Candidate Disease Context
     # -------------------------------------------------
-    async def generate_clarifying_questions(
-        self,
-        diseases: list,
-        initial_symptoms: str
-    ) -> list:
+    def _build_context(self, diseases: list) -> str:
         """
-        Generate up to 4 clarifying questions to distinguish
-        between candidate diseases.
+        Look up every candidate disease by name (vector search
+        only for unknown names) and format the hits as prompt context.
         """
 
-        # -------- Build RAG context safely --------
         context = ""
 
-        for disease in diseases:
-            disease_info = self.rag_engine.search(disease, top_k=1)
+        disease_infos = self.rag_engine.get_disease_contexts(diseases)
 
+        for disease, disease_info in zip(diseases, disease_infos):
             # ⭐ Only include valid RAG results
             if disease_info:
                 context += f"--- {disease} ---\n{disease_info}\n\n"
 
-        # ⭐ If RAG has no useful data
+        # ⭐ Independent reasoning fallback
         if not context.strip():
             context = (
                 "No structured medical database context available. "
                 "Use general medical knowledge."
             )
 
+        return context
+
+    # -------------------------------------------------
+    # Generate Clarifying Questions
+    # -------------------------------------------------
+    async def generate_clarifying_questions(
+        self,
+        diseases: list,
+        initial_symptoms: str,
+        deadline: Optional[Deadline] = None,
+        drafted: Optional[list] = None
+    ) -> list:
+        """
+        Generate up to 4 clarifying questions to distinguish
+        between candidate diseases.
+
+        Served from the precomputed question bank when the
+        candidate set is in it, else from `drafted` (questions the
+        combined analyzer already wrote); the LLM only runs when
+        neither has any. Canned questions are used if it fails or
+        runs out of time.
+        """
+
+        if self.question_bank is not None:
+            banked = await asyncio.to_thread(self.question_bank.get, diseases)
+            if banked:
+                return banked[:4]
+
+        if drafted:
+            return drafted[:4]
+
+        try:
+            return await self.request_clarifying_questions(
+                diseases,
+                initial_symptoms,
+                deadline
+            )
+
+        except Exception as e:
+            print(f"Error generating clarifying questions: {e}")
+
+            # Safe fallback questions
+            return [
+                "Can you describe your symptoms in more detail?",
+                "When did this start?",
+                "Is there anything that makes it better or worse?",
+                "Are you experiencing any other symptoms?"
+            ]
+
+    async def request_clarifying_questions(
+        self,
+        diseases: list,
+        initial_symptoms: str,
+        deadline: Optional[Deadline] = None
+    ) -> list:
+        """
+        Ask the LLM for clarifying questions.
+        Raises on failure (no fallback questions).
+        """
+
+        # -------- Build RAG context safely --------
+        # (off the event loop: unknown names fall back to vector search)
+        context = await asyncio.to_thread(self._build_context, diseases)
+
         prompt = f"""
 You are a clinical diagnostic expert.
 
@@ -71,58 +136,34 @@ Example:
 ["Question 1", "Question 2", "Question 3", "Question 4"]
 """
 
-        try:
-            response = await asyncio.to_thread(
-                client.models.generate_content,
-                model="gemini-2.5-flash-lite",
-                contents=prompt,
-            )
-
-            text = response.text.strip()
-
-            # ---------------- SAFE JSON EXTRACTION ----------------
-            if "```" in text:
-                parts = text.split("```")
-                if len(parts) >= 3:
-                    text = parts[-2].strip()
-
-            start = text.find("[")
-            end = text.rfind("]") + 1
-            text = text[start:end]
+        text = await self.gateway.generate_text(
+            prompt, priority=Priority.CLARIFY, deadline=deadline
+        )
 
-            questions = json.loads(text)
+        # ---------------- SAFE JSON EXTRACTION ----------------
+        if "```" in text:
+            parts = text.split("```")
+            if len(parts) >= 3:
+                text = parts[-2].strip()
 
-            # ---------------- CLEAN QUESTIONS ----------------
-            cleaned_questions = [
-                q.strip().lstrip("1234. ").strip()
-                for q in questions
-            ]
+        start = text.find("[")
+        end = text.rfind("]") + 1
+        text = text[start:end]
 
-            return cleaned_questions[:4]
+        questions = json.loads(text)
 
-        except Exception as e:
-            print(f"Error generating clarifying questions: {e}")
+        # ---------------- CLEAN QUESTIONS ----------------
+        cleaned_questions = [
+            q.strip().lstrip("1234. ").strip()
+            for q in questions
+        ]
 
-            # Safe fallback questions
-            return [
-                "Can you describe your symptoms in more detail?",
-                "When did this start?",
-                "Is there anything that makes it better or worse?",
-                "Are you experiencing any other symptoms?"
-            ]
+        return cleaned_questions[:4]
 
     # -------------------------------------------------
     # Final Diagnosis Generation
     # -------------------------------------------------
-    async def get_final_diagnosis(
-        self,
-        diseases: list,
-        history: list
-    ) -> str:
-        """
-        Finalize assessment using conversation history
-        and candidate diseases.
-        """
+    async def _final_diagnosis_prompt(self, diseases: list, history: list) -> str:
 
         # -------- Format conversation history --------
         history_text = ""
@@ -131,23 +172,10 @@ Example:
             content = msg.get("parts", [""])[0]
             history_text += f"{role}: {content}\n"
 
-        # -------- Build RAG context safely --------
-        context = ""
-
-        for disease in diseases:
-            disease_info = self.rag_engine.search(disease, top_k=1)
-
-            if disease_info:
-                context += f"--- {disease} ---\n{disease_info}\n\n"
-
-        # ⭐ Independent reasoning fallback
-        if not context.strip():
-            context = (
-                "No structured medical database context available. "
-                "Use general medical knowledge."
-            )
+        # -------- Build RAG context safely (off the event loop) --------
+        context = await asyncio.to_thread(self._build_context, diseases)
 
-        prompt = f"""
+        return f"""
 You are an expert doctor.
 
 Based on the conversation history and candidate diseases,
@@ -169,19 +197,51 @@ Candidate Diseases Context:
 Provide a detailed, empathetic response.
 """
 
+    async def get_final_diagnosis(
+        self,
+        diseases: list,
+        history: list,
+        deadline: Optional[Deadline] = None
+    ) -> str:
+        """
+        Finalize assessment using conversation history
+        and candidate diseases.
+        """
+
+        prompt = await self._final_diagnosis_prompt(diseases, history)
+
         try:
-            response = await asyncio.to_thread(
-                client.models.generate_content,
-                model="gemini-2.5-flash-lite",
-                contents=prompt,
+            return await self.gateway.generate_text(
+                prompt, priority=Priority.FINAL, deadline=deadline
             )
 
-            return response.text.strip()
-
         except Exception as e:
             print(f"Error finalizing diagnosis: {e}")
 
-            return (
-                "Based on your symptoms, it is difficult to be certain. "
-                "Please consult a healthcare professional for a formal diagnosis."
-            )
\ No newline at end of file
+            return FINAL_DIAGNOSIS_FALLBACK
+
+    async def stream_final_diagnosis(
+        self,
+        diseases: list,
+        history: list,
+        deadline: Optional[Deadline] = None
+    ) -> AsyncIterator[str]:
+        """
+        Streaming variant of get_final_diagnosis.
+        """
+
+        prompt = await self._final_diagnosis_prompt(diseases, history)
+        sent = False
+
+        try:
+            async for chunk in self.gateway.stream(
+                prompt, priority=Priority.FINAL, deadline=deadline
+            ):
+                sent = True
+                yield chunk
+
+        except Exception as e:
+            print(f"Error streaming diagnosis: {e}")
+
+            if not sent:
+                yield FINAL_DIAGNOSIS_FALLBACK
@@ -0,0 +1,169 @@
+import os
+import time
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+
+
+# ---------------- CONFIG ----------------
+HEDGE_ENABLED = os.getenv("LLM_HEDGE", "1") == "1"
+
+# fire the backup once the call is slower than this percentile
+# of recent calls of the same kind
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+
+# at most this many backups per primary call
+HEDGE_MAX_RATE = float(os.getenv("LLM_HEDGE_MAX_RATE", "0.05"))
+
+# no hedging until a kind has this many latency samples
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 500
+
+# unused hedge credit banked for bursts of slow calls
+MAX_CREDIT = 5.0
+
+
+# =====================================================
+# LATENCY WINDOW
+# =====================================================
+class LatencyWindow:
+    """Latencies of the most recent successful calls"""
+
+    def __init__(self, size: int = LATENCY_WINDOW):
+        self.samples = deque(maxlen=size)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, p: float) -> float:
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * p / 100))
+        return ordered[index]
+
+
+# =====================================================
+# HEDGER
+# =====================================================
+class Hedger:
+    """
+    Tail-latency hedging for idempotent calls.
+
+    If a call has not answered by the HEDGE_PERCENTILE latency of
+    its kind, an identical backup is started; the first success
+    wins and the other is cancelled.
+
+    Backups are paid for with credit earned at HEDGE_MAX_RATE per
+    primary call, so they never exceed that share of traffic.
+    """
+
+    def __init__(
+        self,
+        percentile: float = HEDGE_PERCENTILE,
+        max_rate: float = HEDGE_MAX_RATE,
+        enabled: bool = HEDGE_ENABLED
+    ):
+        self.percentile = percentile
+        self.max_rate = max_rate
+        self.enabled = enabled
+
+        self.latencies: Dict[Hashable, LatencyWindow] = {}
+        self.credit = 0.0
+
+        # metrics
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.primary_wins = 0
+        self.skipped = 0
+
+    def threshold(self, kind: Hashable) -> Optional[float]:
+        """Seconds before a backup is sent, None while warming up"""
+        window = self.latencies.get(kind)
+        if window is None or len(window) < HEDGE_MIN_SAMPLES:
+            return None
+        return window.percentile(self.percentile)
+
+    async def _timed(self, kind: Hashable, call: Callable[[], Awaitable]):
+        started = time.monotonic()
+        result = await call()
+
+        self.latencies.setdefault(kind, LatencyWindow()).add(
+            time.monotonic() - started
+        )
+        return result
+
+    async def run(
+        self,
+        kind: Hashable,
+        call: Callable[[], Awaitable],
+        allow: Optional[Callable[[], bool]] = None
+    ):
+        """
+        Result of call(), hedged. `allow()` is checked before
+        sending a backup (e.g. not while calls are queueing).
+        """
+        self.calls += 1
+        self.credit = min(MAX_CREDIT, self.credit + self.max_rate)
+
+        delay = self.threshold(kind) if self.enabled else None
+        if delay is None:
+            return await self._timed(kind, call)
+
+        primary = asyncio.create_task(self._timed(kind, call))
+        tasks = {primary}
+
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return primary.result()
+
+            if self.credit < 1 or (allow is not None and not allow()):
+                self.skipped += 1
+                return await primary
+
+            self.credit -= 1
+            self.hedged += 1
+            backup = asyncio.create_task(self._timed(kind, call))
+            tasks.add(backup)
+
+            # first success wins; an error only counts once both failed
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(
+                    tasks, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    error = error or task.exception()
+
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            self.hedge_wins += 1
+                        else:
+                            self.primary_wins += 1
+                        return task.result()
+
+            raise error
+
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "hedge_rate": round(self.hedged / self.calls, 4) if self.calls else 0.0,
+            "hedge_wins": self.hedge_wins,
+            "primary_wins": self.primary_wins,
+            "skipped": self.skipped,
+            "thresholds_ms": {
+                getattr(kind, "name", str(kind)): round(self.threshold(kind) * 1000, 1)
+                for kind in self.latencies
+                if self.threshold(kind) is not None
+            },
+        }
@@ -0,0 +1,298 @@
+import os
+import json
+import mmap
+import time
+import shutil
+import hashlib
+import numpy as np
+import faiss
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+
+# =====================================================
+# BUNDLE LAYOUT
+# =====================================================
+#
+# rag_index/
+#   CURRENT                 → name of the active version directory
+#   v-<timestamp>-<hash>/
+#     manifest.json         format version, KB content hash, counts
+#     vocab.npy             vectorizer terms, position == column id
+#     idf.npy               vectorizer idf weights
+#     doc_offsets.npy       int64 byte offsets into doc_blob.bin (n + 1)
+#     doc_blob.bin          utf-8 document texts back to back
+#     names.json            normalized disease name / alias → record key
+#     records.json          KB record key → content hash, passage ids
+#     deleted.npy           tombstoned passage ids (replaced records)
+#     matrix_*.npy          CSR parts      (sparse index)
+#     faiss.index           faiss index    (dense index)
+#     projection.npy        TF-IDF → latent projection (ANN indexes)
+#
+# Every file is written into a fresh version directory and CURRENT is
+# swapped with os.replace, so a reader never sees a half-written bundle
+# and existing memory maps stay valid while a new version is built.
+
+FORMAT_VERSION = 4
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+KEEP_VERSIONS = 2
+
+
+def file_sha256(path: str) -> str:
+    """Content hash of the knowledge base file"""
+    digest = hashlib.sha256()
+
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+# =====================================================
+# LAZY DOCUMENT STORE
+# =====================================================
+class LazyDocuments:
+    """
+    Read-only sequence of documents backed by a memory-mapped
+    text blob. Texts are decoded only when accessed.
+    """
+
+    def __init__(self, blob_path: str, offsets: np.ndarray):
+        self._offsets = offsets
+        self._file = open(blob_path, "rb")
+
+        # mmap refuses zero-length files
+        if os.path.getsize(blob_path) > 0:
+            self._blob = mmap.mmap(
+                self._file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        else:
+            self._blob = b""
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("document index out of range")
+
+        start = int(self._offsets[idx])
+        end = int(self._offsets[idx + 1])
+        return self._blob[start:end].decode("utf-8")
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+
+# =====================================================
+# WRITE
+# =====================================================
+def write_bundle(
+    root: str,
+    manifest: dict,
+    documents,
+    vectorizer: TfidfVectorizer,
+    doc_matrix=None,
+    index=None,
+    names=None,
+    projection=None,
+    records=None,
+    deleted=None,
+) -> str:
+    """
+    Write a new bundle version under `root` and make it current.
+    Returns the version name.
+    """
+
+    os.makedirs(root, exist_ok=True)
+
+    now = time.time()
+    version = (
+        f"v-{time.strftime('%Y%m%dT%H%M%S', time.localtime(now))}"
+        f".{int(now % 1 * 1e6):06d}-{manifest['source_sha256'][:8]}"
+    )
+    tmp_dir = os.path.join(root, f".{version}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    # -------- vectorizer --------
+    vocab = vectorizer.vocabulary_
+    terms = [""] * len(vocab)
+    for term, col in vocab.items():
+        terms[col] = term
+
+    np.save(os.path.join(tmp_dir, "vocab.npy"), np.array(terms, dtype=str))
+    np.save(os.path.join(tmp_dir, "idf.npy"), vectorizer.idf_)
+
+    # -------- documents --------
+    offsets = [0]
+    with open(os.path.join(tmp_dir, "doc_blob.bin"), "wb") as f:
+        for doc in documents:
+            data = doc.encode("utf-8")
+            f.write(data)
+            offsets.append(offsets[-1] + len(data))
+
+    np.save(
+        os.path.join(tmp_dir, "doc_offsets.npy"),
+        np.array(offsets, dtype=np.int64)
+    )
+
+    with open(os.path.join(tmp_dir, "names.json"), "w", encoding="utf-8") as f:
+        json.dump(names or {}, f)
+
+    with open(os.path.join(tmp_dir, "records.json"), "w", encoding="utf-8") as f:
+        json.dump(records or {}, f)
+
+    np.save(
+        os.path.join(tmp_dir, "deleted.npy"),
+        np.array(sorted(deleted or ()), dtype=np.int64)
+    )
+
+    # -------- vectors --------
+    if doc_matrix is not None:
+        np.save(os.path.join(tmp_dir, "matrix_data.npy"), doc_matrix.data)
+        np.save(os.path.join(tmp_dir, "matrix_indices.npy"), doc_matrix.indices)
+        np.save(os.path.join(tmp_dir, "matrix_indptr.npy"), doc_matrix.indptr)
+
+    if index is not None:
+        faiss.write_index(index, os.path.join(tmp_dir, "faiss.index"))
+
+    if projection is not None:
+        np.save(os.path.join(tmp_dir, "projection.npy"), projection)
+
+    # -------- manifest --------
+    manifest = dict(manifest)
+    manifest.update({
+        "format_version": FORMAT_VERSION,
+        "version": version,
+        "created_at": time.time(),
+        "num_docs": len(offsets) - 1,
+        "vocab_size": len(terms),
+    })
+    if doc_matrix is not None:
+        manifest["matrix_shape"] = list(doc_matrix.shape)
+
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    # -------- publish --------
+    os.replace(tmp_dir, os.path.join(root, version))
+
+    current_tmp = os.path.join(root, f".{CURRENT_FILE}.tmp-{os.getpid()}")
+    with open(current_tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(current_tmp, os.path.join(root, CURRENT_FILE))
+
+    _prune_versions(root, version)
+
+    return version
+
+
+def _prune_versions(root: str, current: str):
+    """Keep the newest versions, drop the rest"""
+    versions = sorted(
+        name for name in os.listdir(root)
+        if name.startswith("v-") and name != current
+    )
+
+    for name in versions[:max(0, len(versions) - (KEEP_VERSIONS - 1))]:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+# =====================================================
+# READ
+# =====================================================
+def read_manifest(root: str):
+    """Manifest of the current bundle version, or None"""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), encoding="utf-8") as f:
+            version = f.read().strip()
+
+        with open(
+            os.path.join(root, version, MANIFEST_FILE), encoding="utf-8"
+        ) as f:
+            manifest = json.load(f)
+
+    except (OSError, ValueError):
+        return None
+
+    if manifest.get("format_version") != FORMAT_VERSION:
+        return None
+
+    return manifest
+
+
+def load_bundle(root: str, manifest: dict) -> dict:
+    """
+    Memory-map the bundle described by `manifest`.
+
+    Returns a dict with documents, vectorizer, names, records,
+    deleted and either doc_matrix (sparse) or index (dense).
+    """
+
+    path = os.path.join(root, manifest["version"])
+
+    def arr(name):
+        return np.load(os.path.join(path, name), mmap_mode="r")
+
+    # -------- vectorizer --------
+    terms = np.load(os.path.join(path, "vocab.npy"))
+    vectorizer = TfidfVectorizer(
+        stop_words="english",
+        vocabulary={str(term): col for col, term in enumerate(terms)},
+    )
+    vectorizer.idf_ = np.load(os.path.join(path, "idf.npy"))
+
+    bundle = {
+        "documents": LazyDocuments(
+            os.path.join(path, "doc_blob.bin"),
+            arr("doc_offsets.npy")
+        ),
+        "vectorizer": vectorizer,
+        "names": {},
+        "records": {},
+        "deleted": set(),
+        "doc_matrix": None,
+        "index": None,
+        "projection": None,
+    }
+
+    with open(os.path.join(path, "names.json"), encoding="utf-8") as f:
+        bundle["names"] = json.load(f)
+
+    with open(os.path.join(path, "records.json"), encoding="utf-8") as f:
+        bundle["records"] = json.load(f)
+
+    bundle["deleted"] = set(
+        np.load(os.path.join(path, "deleted.npy")).tolist()
+    )
+
+    # -------- vectors --------
+    if os.path.exists(os.path.join(path, "matrix_data.npy")):
+        bundle["doc_matrix"] = sparse.csr_matrix(
+            (
+                arr("matrix_data.npy"),
+                arr("matrix_indices.npy"),
+                arr("matrix_indptr.npy"),
+            ),
+            shape=tuple(manifest["matrix_shape"]),
+            copy=False,
+        )
+
+    if os.path.exists(os.path.join(path, "projection.npy")):
+        bundle["projection"] = arr("projection.npy")
+
+    index_path = os.path.join(path, "faiss.index")
+    if os.path.exists(index_path):
+        try:
+            bundle["index"] = faiss.read_index(index_path, faiss.IO_FLAG_MMAP)
+        except RuntimeError:
+            # not every index type supports mmap
+            bundle["index"] = faiss.read_index(index_path)
+
+    return bundle
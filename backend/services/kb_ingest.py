@@ -0,0 +1,125 @@
+import os
+import json
+import hashlib
+from typing import Iterator, List
+
+from services.name_index import normalize_name
+
+
+# ---------------- CONFIG ----------------
+PASSAGE_WORDS = int(os.getenv("RAG_PASSAGE_WORDS", "250"))
+PASSAGE_OVERLAP = int(os.getenv("RAG_PASSAGE_OVERLAP", "50"))
+READ_CHUNK = 1 << 16
+
+
+# =====================================================
+# STREAMING RECORD READER
+# =====================================================
+def iter_records(path: str) -> Iterator[dict]:
+    """
+    Yield KB records one at a time from a JSON array file
+    (medical_clean.json) or a JSON Lines file, without
+    loading the whole document.
+    """
+
+    decoder = json.JSONDecoder()
+
+    with open(path, "r", encoding="utf-8") as f:
+        buf = f.read(READ_CHUNK).lstrip()
+        in_array = buf.startswith("[")
+        if in_array:
+            buf = buf[1:]
+
+        eof = False
+        while True:
+            # skip separators between records
+            buf = buf.lstrip().lstrip(",").lstrip()
+
+            if not buf:
+                if eof:
+                    return
+                chunk = f.read(READ_CHUNK)
+                eof = not chunk
+                buf += chunk
+                continue
+
+            if in_array and buf.startswith("]"):
+                return
+
+            try:
+                record, end = decoder.raw_decode(buf)
+            except json.JSONDecodeError:
+                # record spans the chunk boundary → read more
+                if eof:
+                    raise
+                chunk = f.read(READ_CHUNK)
+                eof = not chunk
+                buf += chunk
+                continue
+
+            buf = buf[end:]
+            yield record
+
+
+# =====================================================
+# RECORD → PASSAGES
+# =====================================================
+def record_key(item: dict) -> str:
+    return normalize_name(item.get("disease", ""))
+
+
+def iter_keyed_records(path: str) -> Iterator[tuple]:
+    """(key, record) pairs; repeated disease names get a #n suffix"""
+    seen = {}
+
+    for item in iter_records(path):
+        key = record_key(item)
+        seen[key] = seen.get(key, 0) + 1
+        if seen[key] > 1:
+            key = f"{key}#{seen[key]}"
+        yield key, item
+
+
+def record_hash(item: dict) -> str:
+    data = json.dumps(item, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def record_names(item: dict) -> List[str]:
+    """Primary name first, then aliases"""
+    return [item.get("disease", "")] + list(item.get("also_called", []))
+
+
+def split_passages(
+    text: str,
+    max_words: int = PASSAGE_WORDS,
+    overlap: int = PASSAGE_OVERLAP,
+) -> List[str]:
+    """Split long text into overlapping word windows"""
+    words = text.split()
+    if len(words) <= max_words:
+        return [text.strip()]
+
+    step = max(1, max_words - overlap)
+    passages = []
+
+    for start in range(0, len(words), step):
+        passages.append(" ".join(words[start:start + max_words]))
+        if start + max_words >= len(words):
+            break
+
+    return passages
+
+
+def record_passages(item: dict) -> List[str]:
+    """Document texts for one KB record, one per summary passage"""
+    header = f"""
+Disease: {item.get('disease', '')}
+Also Called: {', '.join(item.get('also_called', []))}
+Category: {', '.join(item.get('category', []))}
+""".strip()
+
+    return [
+        f"{header}\nSummary: {passage}"
+        for passage in split_passages(item.get("summary", ""))
+    ]
@@ -0,0 +1,382 @@
+import os
+import httpx
+import asyncio
+from typing import AsyncIterator, Optional
+from google import genai
+from google.genai import errors, types
+from dotenv import load_dotenv
+
+from services.circuit_breaker import CircuitBreaker
+from services.deadline import Deadline, DeadlineExceeded, within
+from services.hedging import Hedger
+from services.llm_scheduler import Priority
+from services.rate_limiter import AdaptiveLimiter, backoff_delay
+
+load_dotenv()
+
+# ---------------- CONFIG ----------------
+API_KEY = os.getenv("GOOGLE_API_KEY")
+if not API_KEY:
+    raise ValueError("GOOGLE_API_KEY missing")
+
+MODEL_NAME = os.getenv("GEMINI_MODEL", "gemini-2.5-flash-lite")
+
+# one pooled HTTP client for every in-flight call
+MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "256"))
+MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "64"))
+REQUEST_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+
+# transient failures (rate limit, overload, network) are retried
+# with jittered exponential backoff inside the gateway
+MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+THROTTLE_STATUS = {429, 503}
+
+# token budget estimate before the real usage is known
+CHARS_PER_TOKEN = 4
+OUTPUT_TOKENS_ESTIMATE = int(os.getenv("LLM_OUTPUT_TOKENS_ESTIMATE", "512"))
+
+
+def _retry_after(exc: Exception) -> Optional[float]:
+    """Provider-requested delay from a Retry-After header or RetryInfo"""
+
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if headers and headers.get("retry-after"):
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            pass
+
+    # {"error": {"details": [{"@type": "...RetryInfo", "retryDelay": "12s"}]}}
+    details = getattr(exc, "details", None)
+    error = details.get("error", {}) if isinstance(details, dict) else {}
+
+    for item in error.get("details") or []:
+        delay = item.get("retryDelay", "") if isinstance(item, dict) else ""
+        if delay.endswith("s"):
+            try:
+                return float(delay[:-1])
+            except ValueError:
+                pass
+
+    return None
+
+
+def classify_error(exc: Exception) -> tuple:
+    """(retryable, throttled, retry_after) for a failed call"""
+
+    if isinstance(exc, errors.APIError):
+        return (
+            exc.code in RETRYABLE_STATUS,
+            exc.code in THROTTLE_STATUS,
+            _retry_after(exc),
+        )
+
+    if isinstance(exc, httpx.TransportError):
+        return True, False, None
+
+    return False, False, None
+
+
+def is_outage(exc: Exception) -> bool:
+    """
+    Failures that say the provider itself is unhealthy. Rate
+    limits and bad requests do not; the limiter handles the first.
+    Neither does the caller's own deadline running out.
+    """
+    if isinstance(exc, errors.APIError):
+        return exc.code >= 500
+
+    if isinstance(exc, DeadlineExceeded):
+        return False
+
+    # httpx.TimeoutException is a TransportError
+    return isinstance(exc, (asyncio.TimeoutError, httpx.TransportError))
+
+
+# =====================================================
+# LLM GATEWAY
+# =====================================================
+class LLMGateway:
+    """
+    Shared async Gemini client.
+
+    Calls go through the SDK's native asyncio interface
+    (client.aio) over one pooled HTTP connection, so an
+    in-flight request costs a coroutine, not an executor thread.
+
+    Every call is admitted by one AdaptiveLimiter (RPM/TPM
+    buckets + AIMD concurrency window) and transient failures
+    are retried here, so callers make a single call. Slow
+    non-streaming calls are hedged with a backup request.
+
+    A circuit breaker in front of it all fails calls at once
+    with CircuitOpen while the provider is down, so callers go
+    straight to their fallbacks.
+    """
+
+    def __init__(self, api_key: str = API_KEY, model: str = MODEL_NAME):
+        self.model = model
+
+        self.client = genai.Client(
+            api_key=api_key,
+            http_options=types.HttpOptions(
+                timeout=int(REQUEST_TIMEOUT * 1000),
+                async_client_args={
+                    "limits": httpx.Limits(
+                        max_connections=MAX_CONNECTIONS,
+                        max_keepalive_connections=MAX_KEEPALIVE,
+                    ),
+                },
+            ),
+        )
+
+        self.limiter = AdaptiveLimiter()
+        self.hedger = Hedger()
+        self.breaker = CircuitBreaker()
+        self.max_attempts = MAX_ATTEMPTS
+
+        self.in_flight = 0
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.deadline_expired = 0
+
+    @staticmethod
+    def _estimate_tokens(prompt: str) -> int:
+        return len(prompt) // CHARS_PER_TOKEN + OUTPUT_TOKENS_ESTIMATE
+
+    async def _admit(
+        self,
+        estimate: int,
+        priority: Priority,
+        deadline: Optional[Deadline]
+    ) -> bool:
+        """
+        Pass the breaker and the limiter for one call. Returns
+        whether the call is a breaker probe.
+        """
+        probe = self.breaker.before_call()
+
+        try:
+            await self.limiter.acquire(
+                estimate, priority, deadline.at if deadline else None
+            )
+        except BaseException:
+            self.breaker.record_abandoned(probe)
+            raise
+
+        return probe
+
+    def _failed(self, exc: Exception, probe: bool):
+        """Record a failed call and free its limiter slot"""
+        self.errors += 1
+        _, throttled, retry_after = classify_error(exc)
+
+        if isinstance(exc, DeadlineExceeded):
+            self.deadline_expired += 1
+        elif isinstance(exc, (asyncio.TimeoutError, httpx.TimeoutException)):
+            self.timeouts += 1
+
+        self.limiter.release(
+            success=False, throttled=throttled, retry_after=retry_after
+        )
+
+        if isinstance(exc, DeadlineExceeded):
+            # says nothing about the provider either way
+            self.breaker.record_abandoned(probe)
+        elif is_outage(exc):
+            self.breaker.record_failure(probe)
+        else:
+            # the provider answered, just not with a result
+            self.breaker.record_success(probe)
+
+    def _abandoned(self, probe: bool):
+        """Call cancelled mid-flight (client gone, lost hedge)"""
+        self.limiter.release(success=False)
+        self.breaker.record_abandoned(probe)
+
+    def _retry_delay(
+        self,
+        exc: Exception,
+        attempt: int,
+        deadline: Optional[Deadline],
+        retry: bool = True
+    ) -> Optional[float]:
+        """
+        Backoff before the next attempt, or None when the error
+        should be raised.
+        """
+        retryable, _, retry_after = classify_error(exc)
+
+        if not (retry and retryable) or attempt + 1 >= self.max_attempts:
+            return None
+
+        delay = backoff_delay(attempt, retry_after)
+
+        # no point waiting for a retry that would start too late
+        if deadline is not None and delay >= deadline.remaining():
+            return None
+
+        self.retries += 1
+        print(f"Gemini error ({exc}) → retry {attempt + 1} in {delay:.1f}s")
+
+        return delay
+
+    def _succeeded(self, estimate: int, usage, probe: bool):
+        self.limiter.release()
+        self.breaker.record_success(probe)
+        self.limiter.used_tokens(estimate, getattr(usage, "total_token_count", None))
+
+    async def generate(
+        self,
+        prompt: str,
+        config=None,
+        priority: Priority = Priority.ANSWER,
+        deadline: Optional[Deadline] = None
+    ):
+        """
+        Raw generate_content response.
+
+        Raises LLMShed if the call is dropped under load (queue
+        full, or no slot before `deadline` / its priority's wait),
+        and asyncio.TimeoutError if `deadline` passes in flight.
+        """
+        estimate = self._estimate_tokens(prompt)
+
+        def attempt_once():
+            return self._generate_once(prompt, config, estimate, priority, deadline)
+
+        for attempt in range(self.max_attempts):
+            try:
+                # backups only while nothing is queueing for a slot
+                return await self.hedger.run(
+                    priority, attempt_once, allow=lambda: not self.limiter.queue
+                )
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, deadline)
+                if delay is None:
+                    raise
+
+            await asyncio.sleep(delay)
+
+    async def _generate_once(
+        self,
+        prompt: str,
+        config,
+        estimate: int,
+        priority: Priority,
+        deadline: Optional[Deadline]
+    ):
+        """One admitted generate_content call, no retries"""
+        probe = await self._admit(estimate, priority, deadline)
+        self.in_flight += 1
+        self.calls += 1
+
+        try:
+            response = await within(deadline, self.client.aio.models.generate_content(
+                model=self.model,
+                contents=prompt,
+                config=config,
+            ))
+        except Exception as e:
+            self._failed(e, probe)
+            raise
+        except BaseException:
+            self._abandoned(probe)
+            raise
+        finally:
+            self.in_flight -= 1
+
+        self._succeeded(estimate, getattr(response, "usage_metadata", None), probe)
+        return response
+
+    async def generate_text(
+        self,
+        prompt: str,
+        config=None,
+        priority: Priority = Priority.ANSWER,
+        deadline: Optional[Deadline] = None
+    ) -> str:
+        response = await self.generate(prompt, config, priority, deadline)
+        return response.text.strip()
+
+    async def stream(
+        self,
+        prompt: str,
+        config=None,
+        priority: Priority = Priority.ANSWER,
+        deadline: Optional[Deadline] = None
+    ) -> AsyncIterator[str]:
+        """
+        Yield response text chunks as they arrive.
+
+        Retried only until the first chunk: text already sent
+        cannot be taken back. Likewise `deadline` bounds the wait
+        for the first chunk; after that the reply streams freely.
+        """
+        estimate = self._estimate_tokens(prompt)
+
+        for attempt in range(self.max_attempts):
+            probe = await self._admit(estimate, priority, deadline)
+            self.in_flight += 1
+            self.calls += 1
+
+            sent = False
+            usage = None
+
+            try:
+                chunks = await within(deadline, self.client.aio.models.generate_content_stream(
+                    model=self.model,
+                    contents=prompt,
+                    config=config,
+                ))
+                chunks = aiter(chunks)
+
+                while True:
+                    try:
+                        chunk = await within(None if sent else deadline, anext(chunks))
+                    except StopAsyncIteration:
+                        break
+
+                    usage = getattr(chunk, "usage_metadata", None) or usage
+                    if chunk.text:
+                        sent = True
+                        yield chunk.text
+            except Exception as e:
+                self._failed(e, probe)
+                delay = self._retry_delay(e, attempt, deadline, retry=not sent)
+                if delay is None:
+                    raise
+            except BaseException:
+                self._abandoned(probe)
+                raise
+            else:
+                self._succeeded(estimate, usage, probe)
+                return
+            finally:
+                self.in_flight -= 1
+
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        await self.client.aio.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model,
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "deadline_expired": self.deadline_expired,
+            "limiter": self.limiter.stats(),
+            "hedging": self.hedger.stats(),
+            "breaker": self.breaker.stats(),
+        }
+
+
+# shared by LLMService, QueryAnalyzer and DiagnosisService
+gateway = LLMGateway()
@@ -0,0 +1,123 @@
+import heapq
+import asyncio
+import itertools
+from enum import IntEnum
+from typing import Optional
+
+
+# =====================================================
+# PRIORITIES
+# =====================================================
+class Priority(IntEnum):
+    """Lower value is served first"""
+    FINAL = 0        # final diagnosis after the interview
+    CLARIFY = 1      # clarifying questions
+    ANALYSIS = 2     # query analyzer
+    ANSWER = 3       # free-form / RAG answers
+
+
+# waiters allowed per priority before new calls are shed
+QUEUE_LIMITS = {
+    Priority.FINAL: 256,
+    Priority.CLARIFY: 128,
+    Priority.ANALYSIS: 128,
+    Priority.ANSWER: 64,
+}
+
+# seconds a call may wait for a slot before it is stale
+MAX_QUEUE_WAIT = {
+    Priority.FINAL: 20.0,
+    Priority.CLARIFY: 8.0,
+    Priority.ANALYSIS: 5.0,
+    Priority.ANSWER: 10.0,
+}
+
+
+class LLMShed(Exception):
+    """A call was dropped before reaching the provider"""
+
+    def __init__(self, priority: Priority, reason: str):
+        super().__init__(f"{priority.name} call shed: {reason}")
+        self.priority = priority
+        self.reason = reason
+
+
+# =====================================================
+# SLOT QUEUE
+# =====================================================
+class SlotQueue:
+    """
+    Calls waiting for an LLM slot, highest priority first and
+    FIFO within a priority.
+
+    Bounded per priority; a waiter that gives up (timeout or
+    cancellation) is skipped lazily when it reaches the front.
+    """
+
+    def __init__(self, limits: dict = QUEUE_LIMITS, max_wait: dict = MAX_QUEUE_WAIT):
+        self.limits = limits
+        self.max_wait = max_wait
+
+        self._heap = []
+        self._seq = itertools.count()
+        self.queued = {p: 0 for p in Priority}
+        self.shed = {p: 0 for p in Priority}
+
+    def __len__(self):
+        return sum(self.queued.values())
+
+    def wait_limit(self, priority: Priority, remaining: Optional[float]) -> float:
+        """Longest this call may queue; sheds it if that is nothing"""
+        limit = self.max_wait[priority]
+
+        if remaining is not None:
+            limit = min(limit, remaining)
+
+        if limit <= 0:
+            self.shed[priority] += 1
+            raise LLMShed(priority, "deadline passed")
+
+        return limit
+
+    def push(self, priority: Priority) -> asyncio.Future:
+        if self.queued[priority] >= self.limits[priority]:
+            self.shed[priority] += 1
+            raise LLMShed(priority, "queue full")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (priority, next(self._seq), future))
+        self.queued[priority] += 1
+
+        return future
+
+    def pop(self) -> Optional[asyncio.Future]:
+        """Next live waiter, or None"""
+        while self._heap:
+            priority, _, future = heapq.heappop(self._heap)
+            if not future.done():
+                self.queued[priority] -= 1
+                return future
+
+        return None
+
+    def abandon(self, priority: Priority, future: asyncio.Future, stale: bool) -> bool:
+        """
+        Withdraw a waiter. False if it was already granted a slot,
+        which the caller then has to give back.
+        """
+        if future.done() and not future.cancelled():
+            return False
+
+        future.cancel()
+        self.queued[priority] -= 1
+
+        if stale:
+            self.shed[priority] += 1
+
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "queued": {p.name: n for p, n in self.queued.items()},
+            "shed": {p.name: n for p, n in self.shed.items()},
+        }
@@ -1,22 +1,97 @@
-import os
+import re
 import asyncio
-from google import genai
-from dotenv import load_dotenv
-from typing import List
+from typing import AsyncIterator, List, Optional
 
-load_dotenv()
+from services.deadline import Deadline
+from services.llm_gateway import LLMGateway, gateway as default_gateway
+from services.llm_scheduler import Priority
+from services.response_cache import ResponseCache
 
-# ---------------- CONFIG ----------------
-API_KEY = os.getenv("GOOGLE_API_KEY")
-if not API_KEY:
-    raise ValueError("GOOGLE_API_KEY missing")
+BUSY_MESSAGE = "Server busy. Try again."
 
-client = genai.Client(api_key=API_KEY)
+# per-condition summary length in a KB-only answer
+KB_SUMMARY_CHARS = 600
+
+_SENTENCE_END_RE = re.compile(r"[.?!](?=\s)")
+
+
+def _excerpt(summary: str, limit: int = KB_SUMMARY_CHARS) -> str:
+    """
+    Whole sentences from a passage, at most `limit` characters.
+
+    Passages after a record's first start inside a sentence
+    (they overlap the previous one), so a leading fragment that
+    does not start with a capital is dropped.
+    """
+    if summary and not summary[0].isupper():
+        match = _SENTENCE_END_RE.search(summary)
+        if match:
+            summary = summary[match.end():].strip()
+
+    if len(summary) <= limit:
+        return summary
+
+    cut = None
+    for match in _SENTENCE_END_RE.finditer(summary[:limit + 1]):
+        cut = match.end()
+
+    if cut is None:
+        return summary[:limit].rsplit(" ", 1)[0] + "..."
+
+    return summary[:cut]
+
+
+def kb_only_answer(context: str) -> str:
+    """
+    Answer straight from the RAG passages, for when the LLM
+    cannot be used (call shed or failed).
+    """
+
+    sections = {}
+
+    for passage in context.split("\n\n"):
+        title = summary = ""
+
+        for line in passage.splitlines():
+            if line.startswith("Disease:"):
+                title = line[len("Disease:"):].strip()
+            elif line.startswith("Summary:"):
+                summary = line[len("Summary:"):].strip()
+
+        # several chunks of one disease → keep the best ranked
+        if title and summary and title not in sections:
+            summary = _excerpt(summary)
+            if summary:
+                sections[title] = summary
+
+    if not sections:
+        return BUSY_MESSAGE
+
+    body = "\n\n".join(
+        f"**{title}**\n{summary}" for title, summary in sections.items()
+    )
+
+    return f"""### Reference Information
+Our assistant is unavailable right now, so here is what our medical reference says about conditions related to your symptoms:
+
+{body}
+
+### Disclaimer
+This is general educational information, not a diagnosis. Please consult a healthcare professional about your symptoms."""
 
 
 # ---------------- LLM SERVICE ----------------
 class LLMService:
-    def __init__(self):
+    def __init__(
+        self,
+        cache: Optional[ResponseCache] = None,
+        gateway: Optional[LLMGateway] = None
+    ):
+        self.gateway = gateway or default_gateway
+
+        # repeated prompts (mostly RAG mode) are answered from cache
+        self.cache = cache or ResponseCache()
+
         self.system_instruction = """
 You are a professional healthcare AI assistant.
 
@@ -31,13 +106,17 @@ Assessment
 Recommendations
 """
 
-    async def generate_response(
+    # =====================================================
+    # PROMPT
+    # =====================================================
+    def _build_prompt(
         self,
         history: List[dict],
         user_message: str,
-        context: str = "",
-        mode: str = "NORMAL"
-    ) -> str:
+        context: str,
+        mode: str
+    ) -> tuple:
+        """Return (prompt_mode, prompt) for the request"""
 
         # -------- build history --------
         history_text = ""
@@ -52,6 +131,7 @@ Recommendations
         # FOLLOWUP MODE
         # =====================================================
         if mode == "FOLLOWUP":
+            prompt_mode = "FOLLOWUP"
             prompt = f"""
 SYSTEM:
 {self.system_instruction}
@@ -76,6 +156,7 @@ USER ANSWER:
             print(context[:1000])
             print("\n=============================================\n")
 
+            prompt_mode = "RAG"
             prompt = f"""
 SYSTEM:
 {self.system_instruction}
@@ -104,31 +185,112 @@ FORMAT STRICTLY:
         else:
             print("\nNo RAG context used for this query\n")
 
+            history_block = (
+                "CHAT HISTORY:\n" + history_text if history_text else ""
+            )
+
+            prompt_mode = "NORMAL"
             prompt = f"""
 SYSTEM:
 {self.system_instruction}
 
-{"CHAT HISTORY:\n" + history_text if history_text else ""}
+{history_block}
 
 USER:
 {user_message}
 """
 
+        return prompt_mode, prompt
+
+    # =====================================================
+    # GENERATE
+    # =====================================================
+    async def generate_response(
+        self,
+        history: List[dict],
+        user_message: str,
+        context: str = "",
+        mode: str = "NORMAL",
+        deadline: Optional[Deadline] = None
+    ) -> str:
+
+        prompt_mode, prompt = self._build_prompt(
+            history, user_message, context, mode
+        )
+
+        # -------- response cache --------
+        use_cache = self.cache.enabled_for(prompt_mode)
+        if use_cache:
+            cached = await self.cache.get(self.gateway.model, prompt)
+            if cached is not None:
+                print(f"LLM cache hit ({prompt_mode})")
+                return cached
+
         # -------- call gemini safely --------
-        for _ in range(2):
-            try:
-                response = await asyncio.to_thread(
-                    client.models.generate_content,
-                    model="gemini-2.5-flash-lite",
-                    contents=prompt,
-                )
-                return response.text.strip()
-
-            except Exception as e:
-                print("Gemini error:", e)
-                await asyncio.sleep(1)
-
-        return "Server busy. Try again."
+        # (transient errors are already retried with backoff by the gateway)
+        try:
+            text = await self.gateway.generate_text(
+                prompt, priority=Priority.ANSWER, deadline=deadline
+            )
+
+        except Exception as e:
+            print("Gemini error:", e)
+            return kb_only_answer(context) if context else BUSY_MESSAGE
+
+        if use_cache:
+            await self.cache.set(
+                self.gateway.model, prompt, prompt_mode, text
+            )
+
+        return text
+
+    # =====================================================
+    # STREAM
+    # =====================================================
+    async def stream_response(
+        self,
+        history: List[dict],
+        user_message: str,
+        context: str = "",
+        mode: str = "NORMAL",
+        deadline: Optional[Deadline] = None
+    ) -> AsyncIterator[str]:
+        """
+        Same prompt as generate_response, yielded as text chunks
+        while Gemini produces them.
+        """
+
+        prompt_mode, prompt = self._build_prompt(
+            history, user_message, context, mode
+        )
+
+        use_cache = self.cache.enabled_for(prompt_mode)
+        if use_cache:
+            cached = await self.cache.get(self.gateway.model, prompt)
+            if cached is not None:
+                print(f"LLM cache hit ({prompt_mode})")
+                yield cached
+                return
+
+        parts = []
+        try:
+            async for chunk in self.gateway.stream(
+                prompt, priority=Priority.ANSWER, deadline=deadline
+            ):
+                parts.append(chunk)
+                yield chunk
+
+        except Exception as e:
+            print("Gemini stream error:", e)
+            # nothing sent yet → same fallback as generate_response
+            if not parts:
+                yield kb_only_answer(context) if context else BUSY_MESSAGE
+            return
+
+        if use_cache and parts:
+            await self.cache.set(
+                self.gateway.model, prompt, prompt_mode, "".join(parts).strip()
+            )
 
 
 # ---------------- TEST ----------------
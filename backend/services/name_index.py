@@ -0,0 +1,166 @@
+import re
+from typing import Dict, Hashable, Iterable, Optional
+
+
+_PAREN_RE = re.compile(r"\(([^)]*)\)")
+_PUNCT_RE = re.compile(r"[^\w\s]")
+_SPACE_RE = re.compile(r"\s+")
+
+# shorter keys only match exactly: "cold" is one edit from "copd"
+MIN_APPROX_LEN = 6
+
+
+def normalize_name(name: str) -> str:
+    """Case-fold, drop punctuation and collapse whitespace"""
+    name = _PUNCT_RE.sub(" ", (name or "").casefold())
+    return _SPACE_RE.sub(" ", name).strip()
+
+
+def name_variants(name: str) -> list:
+    """
+    Normalized spellings a KB title can be referred to by.
+
+    "H1N1 Flu (Swine Flu)" → ["h1n1 flu swine flu", "h1n1 flu", "swine flu"]
+    """
+    variants = [normalize_name(name)]
+
+    inner = _PAREN_RE.findall(name or "")
+    if inner:
+        variants.append(normalize_name(_PAREN_RE.sub(" ", name)))
+        variants.extend(normalize_name(part) for part in inner)
+
+    return [v for v in variants if v]
+
+
+# =====================================================
+# TRIE
+# =====================================================
+class _TrieNode:
+    __slots__ = ("children", "entry")
+
+    def __init__(self):
+        self.children = {}
+        self.entry = None
+
+
+# =====================================================
+# NAME INDEX
+# =====================================================
+class NameIndex:
+    """
+    Exact disease-name / alias lookup, each name mapping to one
+    entry (the RAG engine stores KB record keys).
+
+    A dict gives O(1) hits on normalized names; a character trie
+    over the same keys serves unique word-prefix completions and
+    bounded edit-distance matches for misspelt or plural names.
+    Keys shorter than MIN_APPROX_LEN only match exactly.
+    """
+
+    def __init__(self, names: Optional[Dict[str, Hashable]] = None):
+        self._names: Dict[str, Hashable] = {}
+        self._root = _TrieNode()
+
+        for name, entry in (names or {}).items():
+            self._insert(name, entry)
+
+    def __len__(self):
+        return len(self._names)
+
+    def to_dict(self) -> Dict[str, Hashable]:
+        return dict(self._names)
+
+    # -------------------------------------------------
+    # BUILD
+    # -------------------------------------------------
+    def add(self, name: str, entry: Hashable):
+        """Register `name`; the first entry to claim a name keeps it"""
+        for variant in name_variants(name):
+            if variant not in self._names:
+                self._insert(variant, entry)
+
+    def add_many(self, names: Iterable[str], entry: Hashable):
+        for name in names:
+            self.add(name, entry)
+
+    def _insert(self, key: str, entry: Hashable):
+        self._names[key] = entry
+
+        node = self._root
+        for ch in key:
+            node = node.children.setdefault(ch, _TrieNode())
+        node.entry = entry
+
+    # -------------------------------------------------
+    # LOOKUP
+    # -------------------------------------------------
+    def get(self, name: str) -> Optional[Hashable]:
+        """Exact normalized match"""
+        return self._names.get(normalize_name(name))
+
+    def prefix(self, key: str) -> Optional[Hashable]:
+        """Entry whose name uniquely extends `key` at a word boundary"""
+        if len(key) < MIN_APPROX_LEN:
+            return None
+
+        node = self._root
+        for ch in key:
+            node = node.children.get(ch)
+            if node is None:
+                return None
+
+        node = node.children.get(" ")
+        if node is None:
+            return None
+
+        found = set()
+        stack = [node]
+        while stack and len(found) < 2:
+            node = stack.pop()
+            if node.entry is not None:
+                found.add(node.entry)
+            stack.extend(node.children.values())
+
+        return found.pop() if len(found) == 1 else None
+
+    def fuzzy(self, key: str, max_distance: Optional[int] = None) -> Optional[Hashable]:
+        """
+        Closest name by Levenshtein distance, walking the trie
+        one DP row per node. Ambiguous ties return None.
+        """
+        if max_distance is None:
+            max_distance = 0 if len(key) < MIN_APPROX_LEN else 1 if len(key) <= 8 else 2
+        if max_distance == 0:
+            return None
+
+        best_distance = max_distance
+        best = set()
+
+        first_row = list(range(len(key) + 1))
+        stack = [(child, ch, first_row) for ch, child in self._root.children.items()]
+
+        while stack:
+            node, ch, prev_row = stack.pop()
+
+            row = [prev_row[0] + 1]
+            for col in range(1, len(key) + 1):
+                row.append(min(
+                    row[col - 1] + 1,
+                    prev_row[col] + 1,
+                    prev_row[col - 1] + (key[col - 1] != ch),
+                ))
+
+            if node.entry is not None and row[-1] <= min(best_distance, max_distance):
+                if row[-1] < best_distance:
+                    best_distance = row[-1]
+                    best = set()
+                best.add(node.entry)
+
+            # prune branches that can no longer get close enough
+            if min(row) <= min(best_distance, max_distance):
+                stack.extend(
+                    (child, next_ch, row)
+                    for next_ch, child in node.children.items()
+                )
+
+        return best.pop() if len(best) == 1 else None
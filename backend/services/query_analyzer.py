@@ -1,17 +1,93 @@
 import os
+import re
+import copy
 import json
 import asyncio
-from google import genai
+from typing import Optional
 from pydantic import BaseModel, Field
-from dotenv import load_dotenv
+from google.genai import types
 
-load_dotenv()
+from services.deadline import Deadline
+from services.llm_gateway import LLMGateway, gateway as default_gateway
+from services.llm_scheduler import Priority
+from services.ttl_cache import TTLCache
 
-API_KEY = os.getenv("GOOGLE_API_KEY")
-if not API_KEY:
-    raise ValueError("GOOGLE_API_KEY missing")
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYZER_CACHE_SIZE", "2048"))
+ANALYSIS_CACHE_TTL = float(os.getenv("ANALYZER_CACHE_TTL", "1800"))
 
-client = genai.Client(api_key=API_KEY)
+# one schema-constrained call for analysis + clarifying questions,
+# grounded on KB passages retrieved locally (needs a rag_engine)
+COMBINED_MODE = os.getenv("ANALYZER_COMBINED_MODE", "1") == "1"
+COMBINED_KB_CANDIDATES = int(os.getenv("ANALYZER_KB_CANDIDATES", "5"))
+
+
+# =====================================================
+# LOCAL PRE-CLASSIFIER
+# =====================================================
+# Only unambiguous inputs are decided locally; anything that
+# might describe a symptom still goes to the LLM.
+
+# the whole message must be a greeting / thanks / goodbye
+_GREETING_RE = re.compile(
+    r"^(?:hi+|hello+|hey+|hiya|greetings|namaste|"
+    r"good (?:morning|afternoon|evening|day)|"
+    r"thanks?|thank you|thank u|thx|bye|goodbye)"
+    r"(?: (?:there|doc|doctor|bot|so much|a lot|very much))?$"
+)
+
+# the whole message must be one of these off-topic requests
+_OFF_TOPIC_RE = re.compile(
+    r"^(?:"
+    r"(?:who won|who is winning|what is the score of|score of) (?:the )?"
+    r"(?:[a-z]+ )*(?:match|game|world cup|ipl|nba|fifa|final)(?: today| yesterday)?|"
+    r"(?:what is |whats |how is )?the weather(?: today| tomorrow| forecast)?(?: in [a-z ]+)?|"
+    r"weather forecast(?: for [a-z ]+)?|"
+    r"(?:tell me|tell us) a joke|"
+    r"write (?:me )?(?:a |an )?(?:poem|story|essay|song|code)(?: about [a-z ]+)?|"
+    r"what is the capital of [a-z ]+|"
+    r"(?:what is the )?(?:bitcoin|crypto|stock|share) price(?: today| now)?|"
+    r"who is the (?:president|prime minister) of [a-z ]+"
+    r")$"
+)
+
+# a body part or symptom anywhere sends the message to the LLM
+_BODY_OR_SYMPTOM_RE = re.compile(
+    r"\b(?:pain|ache|aching|hurt|sore|fever|cough|cold|sick|ill|weak|"
+    r"symptom|doctor|medic|pill|drug|dose|prescri|vomit|nause|dizz|rash|"
+    r"itch|bleed|swell|swollen|breath|tired|fatigue|sleep|faint|"
+    r"health|disease|infect|allerg|injur|sprain|twist|cut|burn|bruis|"
+    r"head|migraine|stomach|blood|pregnan|anxi|depress|"
+    r"throat|neck|back|chest|heart|lung|arm|hand|finger|leg|knee|ankle|"
+    r"foot|feet|toe|eye|ear|nose|mouth|tooth|teeth|skin|muscle|joint|bone)\w*\b"
+)
+
+_PUNCT_RE = re.compile(r"[^\w\s]")
+
+
+def _normalize_message(text: str) -> str:
+    text = _PUNCT_RE.sub(" ", (text or "").casefold())
+    return " ".join(text.split())
+
+
+def local_intent(user_message: str):
+    """
+    GREETING for an exact greeting, NON_MEDICAL for a message
+    that is entirely an off-topic request with no body part or
+    symptom in it; None (ask the LLM) for everything else.
+    """
+    text = _normalize_message(user_message)
+
+    # "?", "😟", "..." mid-conversation: let the LLM read them in context
+    if not text:
+        return None
+
+    if _GREETING_RE.match(text):
+        return "GREETING"
+
+    if _OFF_TOPIC_RE.match(text) and not _BODY_OR_SYMPTOM_RE.search(text):
+        return "NON_MEDICAL"
+
+    return None
 
 
 # =====================================================
@@ -25,12 +101,43 @@ class QueryAnalysis(BaseModel):
     potential_diseases: list[str] = Field(default_factory=list)
 
 
+class CombinedAnalysis(QueryAnalysis):
+    clarifying_questions: list[str] = Field(
+        default_factory=list,
+        description="4 questions that tell the potential diseases apart"
+    )
+
+
 # =====================================================
 # ANALYZER CLASS
 # =====================================================
 class QueryAnalyzer:
 
-    def __init__(self):
+    def __init__(
+        self,
+        gateway: Optional[LLMGateway] = None,
+        rag_engine=None,
+        combined: bool = COMBINED_MODE
+    ):
+        self.gateway = gateway or default_gateway
+        self.rag_engine = rag_engine
+        self.combined = combined and rag_engine is not None
+
+        # (normalized message, history window) → analysis
+        self.cache = TTLCache(
+            maxsize=ANALYSIS_CACHE_SIZE,
+            ttl=ANALYSIS_CACHE_TTL
+        )
+
+        self.stats = {
+            "llm_calls": 0,
+            "combined_calls": 0,
+            "cache_hits": 0,
+            "local_greeting": 0,
+            "local_non_medical": 0,
+            "outage_fallbacks": 0,
+        }
+
         self.system_prompt = """
 You are an expert clinical triage AI acting like a real doctor.
 
@@ -52,10 +159,76 @@ RULES:
 - NEVER include explanations outside JSON.
 """
 
+        self.combined_prompt = """
+You are an expert clinical triage AI acting like a real doctor.
+
+RULES:
+- intent = MEDICAL | NON_MEDICAL | GREETING
+- completeness = VAGUE | SPECIFIC
+- Identify up to 3 likely diseases ONLY if enough symptoms exist.
+- Prefer disease names exactly as written in the knowledge base excerpts.
+- If you list potential_diseases, also write EXACTLY 4 clarifying_questions
+  that help distinguish which of them is most likely.
+- If symptoms unclear → VAGUE, and ask natural follow_up_questions
+  (duration, severity, progression, triggers, associated symptoms).
+"""
+
     # =====================================================
     # ANALYZE QUERY
     # =====================================================
-    async def analyze(self, user_message: str, history: list) -> dict:
+    async def analyze(
+        self,
+        user_message: str,
+        history: list,
+        deadline: Optional[Deadline] = None,
+        candidates: Optional[list] = None
+    ) -> dict:
+        """
+        Classify the message. Falls back to _fallback() when the
+        LLM fails or `deadline` passes first, and skips the LLM
+        while the gateway's circuit breaker is open.
+
+        `candidates` are KB (name, passage) pairs the caller has
+        already retrieved for the message (combined mode looks
+        them up itself otherwise).
+        """
+
+        # ---- local fast path: no LLM for greetings / off-topic ----
+        intent = local_intent(user_message)
+        if intent:
+            self.stats[f"local_{intent.lower()}"] += 1
+            return {
+                "intent": intent,
+                "completeness": "SPECIFIC",
+                "follow_up_questions": [],
+                "potential_diseases": [],
+                "search_term": ""
+            }
+
+        # ---- cached analysis for the same message + context ----
+        cache_key = (
+            _normalize_message(user_message),
+            tuple(history[-4:]) if history else ()
+        )
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            self.stats["cache_hits"] += 1
+            return copy.deepcopy(cached)
+
+        # ---- provider down: don't even try ----
+        if self.gateway.breaker.rejecting:
+            self.stats["outage_fallbacks"] += 1
+            return await self._outage_fallback(user_message)
+
+        if self.combined:
+            data = await self._analyze_combined(
+                user_message, history, deadline, candidates
+            )
+            if data is not None:
+                self.cache.set(cache_key, copy.deepcopy(data))
+                return data
+
+            return self._fallback()
 
         # ---- build readable history ----
         history_text = "\n".join(history[-4:]) if history else ""
@@ -77,66 +250,166 @@ User Message:
 Return ONLY JSON.
 """
 
-        for _ in range(2):
-            try:
-                response = await asyncio.to_thread(
-                    client.models.generate_content,
-                    model="gemini-2.5-flash-lite",
-                    contents=prompt,
-                )
-
-                text = response.text.strip()
-
-                # -------------------------------------------------
-                # SAFE JSON EXTRACTION ⭐ (important)
-                # -------------------------------------------------
-                if "```" in text:
-                    parts = text.split("```")
-                    if len(parts) >= 3:
-                        text = parts[-2].strip()
-
-                start = text.find("{")
-                end = text.rfind("}") + 1
-                text = text[start:end]
-
-                data = json.loads(text)
-
-                # -------------------------------------------------
-                # NORMALIZATION SAFETY
-                # -------------------------------------------------
-                data.setdefault("intent", "MEDICAL")
-                data.setdefault("completeness", "VAGUE")
-                data.setdefault("follow_up_questions", [])
-                data.setdefault("potential_diseases", [])
-                data.setdefault("search_term", "")
-
-                # limit diseases strictly
-                data["potential_diseases"] = data["potential_diseases"][:3]
-
-                # ensure followups exist if vague medical
-                if (
-                    data["intent"] == "MEDICAL"
-                    and data["completeness"] == "VAGUE"
-                ):
-                    qs = data["follow_up_questions"]
-
-                    if len(qs) < 2:
-                        qs.extend([
-                            "Since when are you experiencing this?",
-                            "Are there any associated symptoms like fever, pain, or fatigue?"
-                        ])
-
-                    data["follow_up_questions"] = qs[:4]
+        # transient errors are retried with backoff by the gateway;
+        # an unparseable answer falls back straight away
+        try:
+            self.stats["llm_calls"] += 1
+            text = await self.gateway.generate_text(
+                prompt, priority=Priority.ANALYSIS, deadline=deadline
+            )
 
-                return data
+            # -------------------------------------------------
+            # SAFE JSON EXTRACTION ⭐ (important)
+            # -------------------------------------------------
+            if "```" in text:
+                parts = text.split("```")
+                if len(parts) >= 3:
+                    text = parts[-2].strip()
+
+            start = text.find("{")
+            end = text.rfind("}") + 1
+            text = text[start:end]
+
+            data = json.loads(text)
 
-            except Exception as e:
-                print("Analyzer error:", e)
-                await asyncio.sleep(1)
+            # -------------------------------------------------
+            # NORMALIZATION SAFETY
+            # -------------------------------------------------
+            # limit diseases strictly
+            self._normalize(data)
 
-        # -------------------------------------------------
-        # SAFE FALLBACK
-        # -------------------------------------------------
+            self.cache.set(cache_key, copy.deepcopy(data))
+            return data
+
+        except Exception as e:
+            print("Analyzer error:", e)
+
+        return self._fallback()
+
+    # =====================================================
+    # COMBINED ANALYSIS + CLARIFYING QUESTIONS
+    # =====================================================
+    async def _analyze_combined(
+        self,
+        user_message: str,
+        history: list,
+        deadline: Optional[Deadline] = None,
+        candidates: Optional[list] = None
+    ) -> Optional[dict]:
+        """
+        One structured call instead of analyze + a separate
+        clarifying-question call. Returns None on failure.
+        """
+
+        if candidates is None:
+            candidates = await asyncio.to_thread(
+                self.rag_engine.candidate_diseases,
+                user_message,
+                COMBINED_KB_CANDIDATES
+            )
+
+        kb_context = "\n\n".join(
+            f"--- {name} ---\n{text}" for name, text in candidates
+        ) or "No matching knowledge base entries. Use general medical knowledge."
+
+        history_text = "\n".join(history[-4:]) if history else ""
+        turn_count = (len(history) // 2) + 1
+
+        prompt = f"""
+SYSTEM:
+{self.combined_prompt}
+
+Knowledge Base Excerpts:
+{kb_context}
+
+Conversation Turn: {turn_count}/4
+
+Chat History:
+{history_text}
+
+User Message:
+{user_message}
+"""
+
+        config = types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=CombinedAnalysis,
+        )
+
+        try:
+            self.stats["llm_calls"] += 1
+            self.stats["combined_calls"] += 1
+            response = await self.gateway.generate(
+                prompt, config, priority=Priority.ANALYSIS, deadline=deadline
+            )
+
+            parsed = response.parsed
+            if parsed is None:
+                parsed = CombinedAnalysis.model_validate_json(response.text)
+
+        except Exception as e:
+            print("Analyzer error:", e)
+            return None
+
+        data = parsed.model_dump()
+        self._normalize(data)
+
+        data["clarifying_questions"] = [
+            q.strip() for q in data["clarifying_questions"] if q.strip()
+        ][:4]
+
+        return data
+
+    # =====================================================
+    # NORMALIZATION SAFETY
+    # =====================================================
+    @staticmethod
+    def _normalize(data: dict):
+        data.setdefault("intent", "MEDICAL")
+        data.setdefault("completeness", "VAGUE")
+        data.setdefault("follow_up_questions", [])
+        data.setdefault("potential_diseases", [])
+        data.setdefault("search_term", "")
+
+        # limit diseases strictly
+        data["potential_diseases"] = data["potential_diseases"][:3]
+
+        # ensure followups exist if vague medical
+        if (
+            data["intent"] == "MEDICAL"
+            and data["completeness"] == "VAGUE"
+        ):
+            qs = data["follow_up_questions"]
+
+            if len(qs) < 2:
+                qs.extend([
+                    "Since when are you experiencing this?",
+                    "Are there any associated symptoms like fever, pain, or fatigue?"
+                ])
+
+            data["follow_up_questions"] = qs[:4]
+
+    # =====================================================
+    # SAFE FALLBACK
+    # =====================================================
+    async def _outage_fallback(self, user_message: str) -> dict:
+        """
+        Analysis while the LLM is unavailable: a message the KB
+        matches goes down the RAG path (answered KB-only by
+        LLMService), anything else gets the canned follow-ups.
+        """
+        data = self._fallback()
+
+        if self.rag_engine is not None:
+            context = await asyncio.to_thread(self.rag_engine.search, user_message)
+            if context:
+                data["completeness"] = "SPECIFIC"
+                data["follow_up_questions"] = []
+
+        return data
+
+    @staticmethod
+    def _fallback() -> dict:
         return {
             "intent": "MEDICAL",
             "completeness": "VAGUE",
@@ -146,4 +419,19 @@ Return ONLY JSON.
             ],
             "potential_diseases": [],
             "search_term": ""
-        }
\ No newline at end of file
+        }
+
+    # =====================================================
+    # METRICS
+    # =====================================================
+    def get_stats(self) -> dict:
+        avoided = (
+            self.stats["cache_hits"]
+            + self.stats["local_greeting"]
+            + self.stats["local_non_medical"]
+        )
+        return {
+            **self.stats,
+            "llm_calls_avoided": avoided,
+            "cache": self.cache.stats(),
+        }
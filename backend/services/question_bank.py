@@ -0,0 +1,131 @@
+import os
+import gzip
+import json
+from typing import Dict, Iterable, List, Optional
+
+from services.name_index import normalize_name
+
+
+# ---------------- CONFIG ----------------
+QUESTION_BANK_PATH = os.getenv("QUESTION_BANK_PATH", "question_bank.json.gz")
+
+FORMAT_VERSION = 1
+
+
+# =====================================================
+# CLARIFYING-QUESTION BANK
+# =====================================================
+class QuestionBank:
+    """
+    Precomputed clarifying questions per disease, disease pair
+    and disease triple (built by build_question_bank.py).
+
+    Candidate names are resolved to their KB titles through the
+    RAG engine's name index, so "migraines" and "Migraine" hit
+    the same entry; the key is the sorted set of titles.
+    """
+
+    def __init__(
+        self,
+        rag_engine,
+        entries: Optional[Dict[str, List[str]]] = None,
+        source_sha256: Optional[str] = None
+    ):
+        self.rag_engine = rag_engine
+        self.entries = entries or {}
+        self.source_sha256 = source_sha256
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    # =====================================================
+    # KEYS
+    # =====================================================
+    @staticmethod
+    def make_key(titles: Iterable[str]) -> str:
+        return "|".join(sorted({normalize_name(t) for t in titles}))
+
+    def key_for(self, diseases: list) -> Optional[str]:
+        """Bank key for candidate names, None if any is not in the KB"""
+        titles = []
+
+        for disease in diseases:
+            title = self.rag_engine.canonical_name(disease)
+            if title is None:
+                return None
+            titles.append(title)
+
+        return self.make_key(titles) if titles else None
+
+    # =====================================================
+    # LOOKUP
+    # =====================================================
+    def get(self, diseases: list) -> Optional[List[str]]:
+        key = self.key_for(diseases)
+        questions = self.entries.get(key) if key else None
+
+        if questions:
+            self.hits += 1
+            return list(questions)
+
+        self.misses += 1
+        return None
+
+    # =====================================================
+    # PERSISTENCE
+    # =====================================================
+    @classmethod
+    def load(cls, rag_engine, path: str = QUESTION_BANK_PATH) -> "QuestionBank":
+        """Empty bank when the file is missing or unreadable"""
+        if not os.path.exists(path):
+            print(f"No question bank at {path} → clarifying questions via LLM")
+            return cls(rag_engine)
+
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Question bank {path} unreadable: {e}")
+            return cls(rag_engine)
+
+        if data.get("format") != FORMAT_VERSION:
+            print(f"Question bank {path} has an unknown format, ignoring")
+            return cls(rag_engine)
+
+        bank = cls(rag_engine, data.get("entries", {}), data.get("source_sha256"))
+
+        if bank.source_sha256 != rag_engine.source_hash:
+            print("Question bank was built from a different KB version")
+
+        print(f"Question bank loaded with {len(bank)} entries")
+        return bank
+
+    def save(self, path: str = QUESTION_BANK_PATH):
+        tmp_path = f"{path}.tmp"
+
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "format": FORMAT_VERSION,
+                    "source_sha256": self.source_sha256,
+                    "entries": self.entries,
+                },
+                f,
+                ensure_ascii=False,
+                separators=(",", ":"),
+            )
+
+        os.replace(tmp_path, path)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "source_sha256": self.source_sha256,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
@@ -1,115 +1,531 @@
-import json
 import faiss
 import numpy as np
 import os
-import pickle
+from scipy import sparse
+from sklearn.decomposition import TruncatedSVD
 from sklearn.feature_extraction.text import TfidfVectorizer
 
+from services.name_index import NameIndex, normalize_name
+from services.ttl_cache import TTLCache
+from services.kb_ingest import (
+    PASSAGE_OVERLAP,
+    PASSAGE_WORDS,
+    iter_keyed_records,
+    record_hash,
+    record_names,
+    record_passages,
+)
+from services.index_bundle import (
+    file_sha256,
+    load_bundle,
+    read_manifest,
+    write_bundle,
+)
+
+
+# ---------------- CONFIG ----------------
+# "sparse" → CSR matrix + cosine scoring (memory grows with non-zero terms)
+# "flat"   → dense faiss.IndexFlatL2 (vocabulary × documents float32)
+# "ivf"    → faiss.IndexIVFFlat, scans `nprobe` of `nlist` clusters
+# "pq"     → faiss.IndexIVFPQ, IVF clusters + product-quantized codes
+# "hnsw"   → faiss.IndexHNSWFlat graph, beam width `ef_search`
+#
+# Recall vs latency (per query, N passages, d dims):
+#   sparse / flat  exact, O(N) — fine up to ~100k passages.
+#   ivf            ~O(N · nprobe / nlist); recall rises with nprobe,
+#                  nprobe == nlist is exact. Good default at scale.
+#   pq             like ivf but m bytes per vector instead of 4·d, so
+#                  the index fits in RAM at millions of passages;
+#                  distances are approximate → slightly lower recall.
+#   hnsw           ~O(log N), best latency and recall for its memory,
+#                  slowest to build, no training step.
+#
+# The approximate types index raw TF-IDF by default, so the relevance
+# threshold keeps its meaning. RAG_DENSE_DIM=k projects onto k latent
+# dimensions (truncated SVD / LSA) first, which keeps vectors small as
+# the vocabulary grows; "pq" always projects. Latent similarities run
+# higher, so retune RAG_SEARCH_THRESHOLD when projecting.
+INDEX_TYPES = ("sparse", "flat", "ivf", "pq", "hnsw")
+ANN_INDEX_TYPES = ("ivf", "pq", "hnsw")
+DEFAULT_INDEX_TYPE = os.getenv("RAG_INDEX_TYPE", "sparse")
+DEFAULT_INDEX_DIR = os.getenv("RAG_INDEX_DIR")
+
+# build-time parameters (changing them triggers a rebuild)
+DEFAULT_INDEX_PARAMS = {
+    "dense_dim": int(os.getenv("RAG_DENSE_DIM", "0")),
+    "nlist": int(os.getenv("RAG_IVF_NLIST", "0")),  # 0 → ~4·sqrt(N)
+    "pq_m": int(os.getenv("RAG_PQ_M", "32")),
+    "pq_nbits": int(os.getenv("RAG_PQ_NBITS", "8")),
+    "hnsw_m": int(os.getenv("RAG_HNSW_M", "32")),
+}
+
+# incremental updates fall back to a full rebuild past this share of
+# tombstoned passages
+COMPACT_RATIO = float(os.getenv("RAG_COMPACT_RATIO", "0.25"))
+
+# search result cache
+CACHE_SIZE = int(os.getenv("RAG_CACHE_SIZE", "2048"))
+CACHE_TTL = float(os.getenv("RAG_CACHE_TTL", "3600"))
+
+# search-time parameters
+DEFAULT_THRESHOLD = float(os.getenv("RAG_SEARCH_THRESHOLD", "1.2"))
+# looser cut for candidate diseases: symptom descriptions share few
+# terms with a KB entry and typically land at 1.2–1.8
+CANDIDATE_THRESHOLD = float(os.getenv("RAG_CANDIDATE_THRESHOLD", "1.75"))
+DEFAULT_NPROBE = int(os.getenv("RAG_NPROBE", "8"))
+DEFAULT_EF_SEARCH = int(os.getenv("RAG_HNSW_EF_SEARCH", "64"))
+
 
 class RAGEngine:
-    def __init__(self, json_path="medical_clean.json"):
+    def __init__(
+        self,
+        json_path="medical_clean.json",
+        index_type=None,
+        index_dir=None,
+        index_params=None,
+        nprobe=None,
+        ef_search=None
+    ):
+
+        self.index_type = index_type or DEFAULT_INDEX_TYPE
+        if self.index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown RAG index type: {self.index_type}")
+
+        self.index_params = dict(DEFAULT_INDEX_PARAMS, **(index_params or {}))
+        self.nprobe = nprobe or DEFAULT_NPROBE
+        self.ef_search = ef_search or DEFAULT_EF_SEARCH
 
         self.documents = []
         self.index = None
+        self.doc_matrix = None
+        self.projection = None
         self.vectorizer = TfidfVectorizer(stop_words="english")
+        self.names = NameIndex()
+        self.version = None
+
+        # KB record key → {"hash", "doc_ids", "names"}
+        self.records = {}
+        # passage ids superseded by incremental updates
+        self.deleted = set()
+
+        # normalized query → context (or None), dropped on index change
+        self.cache = TTLCache(maxsize=CACHE_SIZE, ttl=CACHE_TTL)
 
-        self.index_file = "faiss_index.bin"
-        self.doc_file = "docs.pkl"
-        self.vec_file = "vectorizer.pkl"
-
-        # ---- Load cache safely ----
-        if (
-            os.path.exists(self.index_file)
-            and os.path.exists(self.doc_file)
-            and os.path.exists(self.vec_file)
-        ):
-            print("Loading cached RAG...")
-            self.load_cache()
+        # bundle lives next to the KB, not in the working directory
+        self.json_path = json_path
+        self.index_dir = index_dir or DEFAULT_INDEX_DIR or os.path.join(
+            os.path.dirname(os.path.abspath(json_path)),
+            "rag_index"
+        )
+
+        # ---- Load cache only if it matches the KB ----
+        self.source_hash = file_sha256(json_path)
+        manifest = read_manifest(self.index_dir)
+
+        if self._is_fresh(manifest):
+            print(f"Loading cached RAG {manifest['version']}...")
+            self.load_cache(manifest)
+        elif self._is_compatible(manifest):
+            print("RAG cache is stale → applying KB changes")
+            self.load_cache(manifest)
+            self.update(json_path)
         else:
-            print("Building RAG first time...")
+            if manifest:
+                print("RAG cache is stale → rebuilding")
+            else:
+                print("Building RAG first time...")
             self.build_index(json_path)
             self.save_cache()
 
+    def _is_fresh(self, manifest) -> bool:
+        return bool(
+            self._is_compatible(manifest)
+            and manifest.get("source_sha256") == self.source_hash
+        )
+
+    def _is_compatible(self, manifest) -> bool:
+        """Same index layout → can be updated incrementally"""
+        return bool(
+            manifest
+            and manifest.get("index_type") == self.index_type
+            and manifest.get("index_params") == self._build_params()
+        )
+
+    def _build_params(self) -> dict:
+        """Build parameters that shape the stored index"""
+        params = {"passage_words": PASSAGE_WORDS, "passage_overlap": PASSAGE_OVERLAP}
+        if self.index_type not in ANN_INDEX_TYPES:
+            return params
+
+        keys = {
+            "ivf": ("dense_dim", "nlist"),
+            "pq": ("dense_dim", "nlist", "pq_m", "pq_nbits"),
+            "hnsw": ("dense_dim", "hnsw_m"),
+        }[self.index_type]
+        params.update({k: self.index_params[k] for k in keys})
+        return params
+
     # =====================================================
     # BUILD INDEX
     # =====================================================
     def build_index(self, path):
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        """
+        Full build: stream KB records, split summaries into
+        overlapping passages and fit the vectorizer in one pass.
+        """
 
-        texts = []
+        self.documents = []
+        self.records = {}
+        self.deleted = set()
+        self.projection = None
 
-        for item in data:
-            text = f"""
-Disease: {item.get('disease', '')}
-Also Called: {', '.join(item.get('also_called', []))}
-Category: {', '.join(item.get('category', []))}
-Summary: {item.get('summary', '')}
-""".strip()
+        def passages():
+            for key, item in iter_keyed_records(path):
+                texts = record_passages(item)
+                start = len(self.documents)
+                self.documents.extend(texts)
 
-            texts.append(text)
-            self.documents.append(text)
+                self.records[key] = {
+                    "hash": record_hash(item),
+                    "doc_ids": list(range(start, len(self.documents))),
+                    "names": record_names(item),
+                }
+                yield from texts
 
         tfidf_matrix = (
             self.vectorizer
-            .fit_transform(texts)
-            .toarray()
+            .fit_transform(passages())
             .astype("float32")
         )
 
-        dim = tfidf_matrix.shape[1]
-        self.index = faiss.IndexFlatL2(dim)
-        self.index.add(tfidf_matrix)
+        if self.index_type == "sparse":
+            # rows are already L2-normalised by TfidfVectorizer
+            self.doc_matrix = tfidf_matrix.tocsr()
+        else:
+            self.index = None
+            self._build_dense_index(tfidf_matrix)
+
+        self._rebuild_names()
+
+        print(
+            f"RAG built with {len(self.records)} entries / "
+            f"{len(self.documents)} passages ({self.index_type} index)"
+        )
+
+    def _rebuild_names(self):
+        # primary names win over aliases of other entries
+        self.names = NameIndex()
+        for key, record in self.records.items():
+            self.names.add(record["names"][0], key)
+        for key, record in self.records.items():
+            self.names.add_many(record["names"][1:], key)
+
+    # =====================================================
+    # INCREMENTAL UPDATE
+    # =====================================================
+    def update(self, path=None):
+        """
+        Apply KB changes without refitting the vectorizer.
+
+        New and changed records are vectorized with the existing
+        vocabulary and appended; passages of changed or removed
+        records are tombstoned. Terms unseen at the last full build
+        are ignored until the next rebuild, which happens
+        automatically once tombstones pass COMPACT_RATIO.
+        """
+
+        path = path or self.json_path
+        new_docs = []
+        seen = set()
+        added = changed = 0
+
+        for key, item in iter_keyed_records(path):
+            seen.add(key)
+            digest = record_hash(item)
+            record = self.records.get(key)
+
+            if record and record["hash"] == digest:
+                continue
+
+            if record:
+                self.deleted.update(record["doc_ids"])
+                changed += 1
+            else:
+                added += 1
+
+            texts = record_passages(item)
+            start = len(self.documents) + len(new_docs)
+            new_docs.extend(texts)
+
+            self.records[key] = {
+                "hash": digest,
+                "doc_ids": list(range(start, start + len(texts))),
+                "names": record_names(item),
+            }
+
+        removed = [key for key in self.records if key not in seen]
+        for key in removed:
+            self.deleted.update(self.records.pop(key)["doc_ids"])
+
+        self.source_hash = file_sha256(path)
+        total = len(self.documents) + len(new_docs)
+
+        if len(self.deleted) > COMPACT_RATIO * total:
+            print("Too many replaced passages → full rebuild")
+            self.build_index(path)
+        else:
+            if new_docs:
+                self._append(new_docs)
+            self._rebuild_names()
+            print(
+                f"RAG updated: {added} added, {changed} changed, "
+                f"{len(removed)} removed"
+            )
+
+        self.cache.clear()
+        self.save_cache()
+
+        return {"added": added, "changed": changed, "removed": len(removed)}
+
+    def _append(self, texts):
+        rows = self.vectorizer.transform(texts).astype("float32")
+
+        if self.index_type == "sparse":
+            self.doc_matrix = sparse.vstack(
+                [self.doc_matrix, rows], format="csr"
+            )
+        else:
+            # a memory-mapped index is read-only
+            self.index = faiss.clone_index(self.index)
+            self._configure_search()
+            self.index.add(self._to_dense(rows))
 
-        print(f"RAG built with {len(self.documents)} entries")
+        # lazy documents are read-only too
+        self.documents = list(self.documents) + list(texts)
+
+    # =====================================================
+    # DENSE / APPROXIMATE INDEXES
+    # =====================================================
+    def _build_dense_index(self, tfidf_matrix):
+        params = self.index_params
+        n_docs, n_terms = tfidf_matrix.shape
+
+        # ---- optional LSA projection for the ANN types ----
+        # PQ codes on raw sparse TF-IDF are meaningless, so pq always
+        # projects (256 dims unless configured)
+        dim = params["dense_dim"]
+        if self.index_type == "pq" and not dim:
+            dim = 256
+        dim = min(dim, n_terms - 1, n_docs)
+        if self.index_type in ANN_INDEX_TYPES and dim > 0:
+            svd = TruncatedSVD(n_components=dim, random_state=42)
+            svd.fit(tfidf_matrix)
+            self.projection = svd.components_.T.astype("float32")
+
+        vectors = self._to_dense(tfidf_matrix)
+        d = vectors.shape[1]
+
+        # ---- index ----
+        nlist = params["nlist"] or int(4 * np.sqrt(n_docs))
+        # faiss wants ~39 training points per centroid
+        nlist = max(1, min(nlist, n_docs // 39))
+
+        if self.index_type == "flat":
+            self.index = faiss.IndexFlatL2(d)
+
+        elif self.index_type == "ivf":
+            quantizer = faiss.IndexFlatL2(d)
+            self.index = faiss.IndexIVFFlat(quantizer, d, nlist)
+
+        elif self.index_type == "pq":
+            # sub-quantizer count must divide the dimension → zero-pad
+            m = params["pq_m"]
+            d = -(-d // m) * m
+            vectors = self._pad(vectors, d)
+            nbits = max(1, min(params["pq_nbits"], int(np.log2(n_docs / 39))))
+            quantizer = faiss.IndexFlatL2(d)
+            self.index = faiss.IndexIVFPQ(quantizer, d, nlist, m, nbits)
+
+        else:
+            self.index = faiss.IndexHNSWFlat(d, params["hnsw_m"])
+
+        # ---- train + add ----
+        if not self.index.is_trained:
+            print(f"Training {self.index_type} index on {n_docs} vectors...")
+            self.index.train(vectors)
+
+        self.index.add(vectors)
+        self._configure_search()
+
+    def _configure_search(self):
+        """Apply search-time knobs (not persisted by faiss)"""
+        if self.index is None:
+            return
+
+        if self.index_type in ("ivf", "pq"):
+            faiss.extract_index_ivf(self.index).nprobe = self.nprobe
+        elif self.index_type == "hnsw":
+            self.index.hnsw.efSearch = self.ef_search
+
+    def _to_dense(self, matrix):
+        """Sparse TF-IDF rows → float32 vectors for faiss"""
+        if self.projection is None:
+            vectors = matrix.toarray().astype("float32")
+        else:
+            vectors = np.ascontiguousarray(
+                matrix @ self.projection, dtype="float32"
+            )
+            # unit length so L2 distances stay comparable to the threshold
+            faiss.normalize_L2(vectors)
+
+        if self.index is not None:
+            vectors = self._pad(vectors, self.index.d)
+        return vectors
+
+    @staticmethod
+    def _pad(vectors, d):
+        """Zero-pad to `d` columns (distances are unchanged)"""
+        if vectors.shape[1] >= d:
+            return vectors
+        return np.pad(vectors, ((0, 0), (0, d - vectors.shape[1])))
 
     # =====================================================
     # CACHE
     # =====================================================
     def save_cache(self):
-        faiss.write_index(self.index, self.index_file)
+        self.version = write_bundle(
+            self.index_dir,
+            {
+                "source": os.path.basename(self.json_path),
+                "source_sha256": self.source_hash,
+                "index_type": self.index_type,
+                "index_params": self._build_params(),
+            },
+            self.documents,
+            self.vectorizer,
+            doc_matrix=self.doc_matrix,
+            index=self.index,
+            names=self.names.to_dict(),
+            projection=self.projection,
+            records=self.records,
+            deleted=self.deleted,
+        )
 
-        with open(self.doc_file, "wb") as f:
-            pickle.dump(self.documents, f)
+        print(f"RAG cache saved ({self.version})")
 
-        with open(self.vec_file, "wb") as f:
-            pickle.dump(self.vectorizer, f)
+    def load_cache(self, manifest):
+        bundle = load_bundle(self.index_dir, manifest)
 
-        print("RAG cache saved")
+        self.documents = bundle["documents"]
+        self.vectorizer = bundle["vectorizer"]
+        self.doc_matrix = bundle["doc_matrix"]
+        self.index = bundle["index"]
+        self.names = NameIndex(bundle["names"])
+        self.projection = bundle["projection"]
+        self.records = bundle["records"]
+        self.deleted = bundle["deleted"]
+        self._configure_search()
+        self.version = manifest["version"]
 
-    def load_cache(self):
-        self.index = faiss.read_index(self.index_file)
+        print("RAG loaded instantly")
 
-        with open(self.doc_file, "rb") as f:
-            self.documents = pickle.load(f)
+    # =====================================================
+    # SCORING
+    # =====================================================
+    def _score(self, query_matrix, top_k):
+        """
+        Return (distances, indices) for each query row, best first.
 
-        with open(self.vec_file, "rb") as f:
-            self.vectorizer = pickle.load(f)
+        Distances are squared L2 on unit vectors for both index
+        types, so the same relevance threshold applies to each.
+        """
+        if self.index_type == "sparse":
+            # cosine == dot product on L2-normalised TF-IDF rows
+            sims = (query_matrix @ self.doc_matrix.T).toarray()
 
-        print("RAG loaded instantly")
+            k = min(top_k, sims.shape[1])
+            top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+            top_sims = np.take_along_axis(sims, top, axis=1)
+
+            order = np.argsort(-top_sims, axis=1)
+            indices = np.take_along_axis(top, order, axis=1)
+            sims = np.take_along_axis(top_sims, order, axis=1)
+
+            # ||a - b||² = 2 - 2·cos(a, b) for unit vectors
+            return 2.0 - 2.0 * sims, indices
+
+        return self.index.search(self._to_dense(query_matrix), top_k)
 
     # =====================================================
     # SEARCH WITH RELEVANCE CHECK ⭐
     # =====================================================
-    def search(self, query, top_k=3, threshold=1.2):
+    def search(self, query, top_k=3, threshold=None):
         """
         Returns medical context if similarity is strong.
         Returns None if no relevant KB match exists.
         """
 
-        if not query or not query.strip():
-            return None
+        return self.search_many([query], top_k=top_k, threshold=threshold)[0]
+
+    def search_many(self, queries, top_k=3, threshold=None):
+        """
+        Batched search: one vectorizer transform and one index
+        search for all queries.
+
+        Returns a list aligned with `queries` holding the context
+        string or None for each query.
+        """
+
+        results = [None] * len(queries)
+        if threshold is None:
+            threshold = DEFAULT_THRESHOLD
+
+        # repeated names / phrases skip vectorizing and scanning
+        live = []
+        for i, q in enumerate(queries):
+            # blank queries never match
+            if not q or not q.strip():
+                continue
 
-        query_vec = (
+            cached = self.cache.get(
+                self._cache_key(q, top_k, threshold), TTLCache.MISSING
+            )
+            if cached is TTLCache.MISSING:
+                live.append(i)
+            else:
+                results[i] = cached
+
+        if not live:
+            return results
+
+        query_vecs = (
             self.vectorizer
-            .transform([query])
-            .toarray()
+            .transform([queries[i] for i in live])
             .astype("float32")
         )
 
-        distances, indices = self.index.search(query_vec, top_k)
+        # over-fetch so tombstoned passages can be skipped
+        fetch_k = min(top_k + len(self.deleted), len(self.documents))
+        distances, indices = self._score(query_vecs, fetch_k)
+
+        for row, i in enumerate(live):
+            hits = self._title_first(
+                queries[i], self._live_hits(distances[row], indices[row])
+            )
+            results[i] = self._context(hits, top_k, threshold)
+
+        for i in live:
+            self.cache.set(
+                self._cache_key(queries[i], top_k, threshold), results[i]
+            )
+
+        return results
+
+    def _context(self, hits, top_k, threshold):
+        """Joined top_k passages, or None if the best is too far"""
+        hits = hits[:top_k]
 
-        best_distance = distances[0][0]
+        best_distance = hits[0][0] if hits else float("inf")
         print(f"RAG similarity distance: {best_distance:.4f}")
 
         # Higher distance = worse similarity
@@ -117,9 +533,229 @@ Summary: {item.get('summary', '')}
             print("No strong KB match → allow LLM reasoning")
             return None
 
-        results = []
-        for idx in indices[0]:
-            if 0 <= idx < len(self.documents):
-                results.append(self.documents[idx])
+        return "\n\n".join(self.documents[idx] for _, idx in hits)
+
+    def _live_hits(self, distances, indices):
+        """(distance, doc_id) pairs, skipping padding and tombstones"""
+        return [
+            (dist, idx)
+            for dist, idx in zip(distances, indices)
+            if 0 <= idx < len(self.documents)
+            and idx not in self.deleted
+        ]
+
+    def _title_first(self, query, hits):
+        """
+        Put the opening passage of the record `query` names first.
+
+        Passages are scored on their own, so a bare name can rank
+        a longer title ("Flu" → "Flu Shot") or a later chunk of
+        the right record above that record's header passage.
+        """
+        key = self.names.get(query)
+        if key not in self.records:
+            return hits
+
+        doc_id = self.records[key]["doc_ids"][0]
+        return [(0.0, doc_id)] + [hit for hit in hits if hit[1] != doc_id]
+
+    @staticmethod
+    def _cache_key(query, top_k, threshold):
+        return (normalize_name(query), top_k, threshold)
+
+    # =====================================================
+    # CANDIDATE DISEASES
+    # =====================================================
+    def candidate_diseases(self, query, limit=3, threshold=None):
+        """
+        Distinct diseases whose passages best match `query`, as
+        (name, passage) pairs, best first. Empty when nothing
+        clears the (loose) candidate threshold.
+        """
+
+        if not query or not query.strip():
+            return []
+        if threshold is None:
+            threshold = CANDIDATE_THRESHOLD
+
+        key = ("candidates",) + self._cache_key(query, limit, threshold)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        candidates = self._candidates(
+            self._query_hits(query, limit * 4), limit, threshold
+        )
+
+        self.cache.set(key, candidates)
+        return candidates
+
+    def retrieve(self, query, limit=3, top_k=3):
+        """
+        (search(query, top_k), candidate_diseases(query, limit))
+        with default thresholds, from one scoring pass.
+        """
+
+        if not query or not query.strip():
+            return None, []
+
+        context_key = self._cache_key(query, top_k, DEFAULT_THRESHOLD)
+        candidates_key = ("candidates",) + self._cache_key(
+            query, limit, CANDIDATE_THRESHOLD
+        )
+
+        context = self.cache.get(context_key, TTLCache.MISSING)
+        candidates = self.cache.get(candidates_key)
+        if context is not TTLCache.MISSING and candidates is not None:
+            return context, candidates
+
+        hits = self._query_hits(query, max(top_k, limit * 4))
+
+        context = self._context(hits, top_k, DEFAULT_THRESHOLD)
+        candidates = self._candidates(hits, limit, CANDIDATE_THRESHOLD)
+
+        self.cache.set(context_key, context)
+        self.cache.set(candidates_key, candidates)
+        return context, candidates
+
+    def _query_hits(self, query, k):
+        query_vec = self.vectorizer.transform([query]).astype("float32")
+
+        # over-fetch so tombstoned passages can be skipped
+        fetch_k = min(k + len(self.deleted), len(self.documents))
+        distances, indices = self._score(query_vec, fetch_k)
+
+        hits = self._live_hits(distances[0], indices[0])
+        return self._title_first(query, hits)
+
+    def _candidates(self, hits, limit, threshold):
+        # several passages may belong to the same disease
+        candidates = []
+        seen = set()
+
+        for dist, idx in hits:
+            if dist > threshold or len(candidates) >= limit:
+                break
+
+            name = self.doc_title(idx)
+
+            if name and name not in seen:
+                seen.add(name)
+                candidates.append((name, self.documents[idx]))
+
+        return candidates
+
+    # =====================================================
+    # DISEASE NAME LOOKUP
+    # =====================================================
+    def _resolve_name(self, name):
+        """
+        KB record key for a disease name or alias, or None.
+
+        Exact dictionary hit, then the closest spelling within a
+        small edit distance (plurals, typos), then a unique prefix
+        completion, so "Heart Disease" is "Heart Diseases" and
+        never "Heart Disease in Women". A prefix hit is only kept
+        when vector search does not confidently point at a
+        different disease; then the vector hit's record is used.
+        """
+
+        key = normalize_name(name)
+        if not key:
+            return None
+
+        entry = self.names.get(key)
+        if entry is None:
+            entry = self.names.fuzzy(key)
+
+        if entry is None:
+            entry = self.names.prefix(key)
+
+            if entry is not None:
+                title = self._vector_title(name)
+                if title is not None and title != self.record_title(entry):
+                    entry = self.names.get(title)
+
+        if entry not in self.records:
+            return None
+
+        return entry
+
+    def _vector_title(self, name):
+        """Title of the confident top vector hit for `name`, else None"""
+        hits = self._query_hits(name, 1)[:1]
+
+        # misspellings share no terms with anything → no opinion
+        if not hits or hits[0][0] > DEFAULT_THRESHOLD:
+            return None
+
+        return self.doc_title(hits[0][1])
+
+    def lookup(self, name):
+        """
+        KB entry for a disease name or alias, or None.
+        Exact dictionary hit first, then a vector-checked trie
+        prefix / fuzzy match.
+        """
+
+        key = self._resolve_name(name)
+        if key is None:
+            return None
+
+        return self.record_text(key)
+
+    def record_text(self, key):
+        """
+        Whole KB entry for a record: the shared header and every
+        passage's summary, overlaps removed, in order.
+        """
+        doc_ids = self.records[key]["doc_ids"]
+
+        header, _, summary = self.documents[doc_ids[0]].partition("\nSummary: ")
+        words = summary.split()
+        for doc_id in doc_ids[1:]:
+            passage = self.documents[doc_id].partition("\nSummary: ")[2]
+            words.extend(passage.split()[PASSAGE_OVERLAP:])
+
+        return f"{header}\nSummary: {' '.join(words)}"
+
+    def doc_title(self, doc_id):
+        """Disease name from a passage's "Disease:" header line"""
+        first_line = self.documents[doc_id].split("\n", 1)[0]
+        return first_line.replace("Disease:", "", 1).strip()
+
+    def record_title(self, key):
+        return self.doc_title(self.records[key]["doc_ids"][0])
+
+    def canonical_name(self, name):
+        """
+        KB title for a disease name, alias or near-miss spelling,
+        or None if the name index has no match.
+        """
+
+        key = self._resolve_name(name)
+        if key is None:
+            return None
+
+        return self.record_title(key)
+
+    def get_disease_contexts(self, diseases):
+        """
+        KB context for each candidate disease name.
+
+        Names resolve through the name index; only the misses go
+        through one batched vector search.
+        """
+
+        contexts = [self.lookup(d) for d in diseases]
+
+        misses = [i for i, ctx in enumerate(contexts) if ctx is None]
+        if misses:
+            found = self.search_many(
+                [diseases[i] for i in misses],
+                top_k=1
+            )
+            for i, ctx in zip(misses, found):
+                contexts[i] = ctx
 
-        return "\n\n".join(results)
\ No newline at end of file
+        return contexts
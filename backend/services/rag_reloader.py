@@ -0,0 +1,99 @@
+import time
+import asyncio
+from typing import Optional
+
+from services.rag_engine import RAGEngine
+
+
+# =====================================================
+# HOT-RELOADABLE RAG ENGINE
+# =====================================================
+class ReloadableRAGEngine:
+    """
+    Drop-in wrapper around RAGEngine that can swap in a new
+    index while requests keep being served from the old one.
+
+    The replacement engine is built in a worker thread; the swap
+    is a single reference assignment, so every call sees either
+    the old or the new engine, never a mix.
+    """
+
+    def __init__(self, json_path="medical_clean.json", **engine_kwargs):
+        self.json_path = json_path
+        self.engine_kwargs = engine_kwargs
+
+        self._engine = RAGEngine(json_path, **engine_kwargs)
+        self._loaded_at = time.time()
+        self._reload_task: Optional[asyncio.Task] = None
+        self._last_error: Optional[str] = None
+
+    @property
+    def engine(self) -> RAGEngine:
+        return self._engine
+
+    def __getattr__(self, name):
+        # search / search_many / lookup / ... go to the live engine
+        return getattr(self._engine, name)
+
+    # =====================================================
+    # RELOAD
+    # =====================================================
+    @property
+    def reloading(self) -> bool:
+        return self._reload_task is not None and not self._reload_task.done()
+
+    def start_reload(self, json_path: Optional[str] = None) -> bool:
+        """
+        Kick off a background reload.
+        Returns False if one is already running.
+        """
+        if self.reloading:
+            return False
+
+        self._reload_task = asyncio.create_task(self.reload(json_path))
+        return True
+
+    async def reload(self, json_path: Optional[str] = None):
+        """Build a fresh engine off the event loop, then swap it in"""
+        json_path = json_path or self.json_path
+        print(f"Reloading RAG from {json_path}...")
+
+        try:
+            engine = await asyncio.to_thread(
+                RAGEngine, json_path, **self.engine_kwargs
+            )
+        except Exception as e:
+            self._last_error = str(e)
+            print(f"RAG reload failed, keeping {self._engine.version}: {e}")
+            return
+
+        previous = self._engine
+
+        self.json_path = json_path
+        self._engine = engine
+        self._loaded_at = time.time()
+        self._last_error = None
+
+        # results from the old index must not outlive it
+        previous.cache.clear()
+
+        print(f"RAG swapped {previous.version} → {engine.version}")
+
+    # =====================================================
+    # STATUS
+    # =====================================================
+    def status(self) -> dict:
+        engine = self._engine
+
+        return {
+            "version": engine.version,
+            "source": self.json_path,
+            "source_sha256": engine.source_hash,
+            "index_type": engine.index_type,
+            "entries": len(engine.records),
+            "passages": len(engine.documents) - len(engine.deleted),
+            "loaded_at": self._loaded_at,
+            "reloading": self.reloading,
+            "last_error": self._last_error,
+            "search_cache": engine.cache.stats(),
+        }
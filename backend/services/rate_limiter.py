@@ -0,0 +1,243 @@
+import os
+import time
+import random
+import asyncio
+from typing import Optional
+
+from services.llm_scheduler import LLMShed, Priority, SlotQueue
+
+
+# ---------------- CONFIG ----------------
+# provider quota (0 disables a bucket)
+LLM_RPM = float(os.getenv("LLM_RPM", "4000"))
+LLM_TPM = float(os.getenv("LLM_TPM", "4000000"))
+
+# AIMD concurrency window: grows by ~1 per window of successes,
+# halves on a rate-limit / overload response
+LLM_CONCURRENCY_START = float(os.getenv("LLM_CONCURRENCY_START", "16"))
+LLM_CONCURRENCY_MIN = float(os.getenv("LLM_CONCURRENCY_MIN", "1"))
+LLM_CONCURRENCY_MAX = float(os.getenv("LLM_CONCURRENCY_MAX", "128"))
+
+# a burst of throttled calls only halves the window once
+DECREASE_COOLDOWN = 1.0
+
+# retry backoff: full jitter over base * 2^attempt, capped
+BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+BACKOFF_CAP = float(os.getenv("LLM_BACKOFF_CAP", "20"))
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """
+    Seconds to wait before retry number `attempt` (0-based).
+
+    Jittered so callers throttled together do not retry together;
+    never shorter than the provider's retry-after.
+    """
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+
+    return delay
+
+
+# =====================================================
+# TOKEN BUCKET
+# =====================================================
+class TokenBucket:
+    """
+    `per_minute` units refilled continuously, up to one minute's
+    worth banked. Waiters are served in arrival order.
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def take(self, amount: float) -> float:
+        """Wait until `amount` is available, take it; returns seconds waited"""
+        # a request larger than the bucket waits for a full bucket
+        amount = min(amount, self.capacity)
+        waited = 0.0
+
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                delay = (amount - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+                self._refill()
+
+            self.tokens -= amount
+
+        return waited
+
+    def adjust(self, amount: float):
+        """Correct an earlier estimate (may go into debt)"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+# =====================================================
+# ADAPTIVE LIMITER
+# =====================================================
+class AdaptiveLimiter:
+    """
+    Admission control for outgoing LLM calls.
+
+    A call first waits for a slot in the concurrency window, then
+    for request and token budget. The window follows AIMD: each
+    success widens it by 1/window, a rate-limit or overload
+    response halves it, and a retry-after pauses every caller.
+
+    Free slots go to the highest-priority waiter (SlotQueue);
+    calls that cannot get one in time are shed with LLMShed.
+    """
+
+    def __init__(
+        self,
+        rpm: float = LLM_RPM,
+        tpm: float = LLM_TPM,
+        start: float = LLM_CONCURRENCY_START,
+        minimum: float = LLM_CONCURRENCY_MIN,
+        maximum: float = LLM_CONCURRENCY_MAX
+    ):
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+
+        self.window = start
+        self.minimum = minimum
+        self.maximum = maximum
+
+        self.active = 0
+        self.waiting = 0
+        self.queue = SlotQueue()
+        self._last_decrease = 0.0
+        self._paused_until = 0.0
+
+        # metrics
+        self.admitted = 0
+        self.throttled = 0
+        self.max_waiting = 0
+        self.wait_time = 0.0
+
+    async def acquire(
+        self,
+        estimated_tokens: float = 0,
+        priority: Priority = Priority.ANSWER,
+        deadline: Optional[float] = None
+    ):
+        """
+        Wait for permission to send one call. `deadline` is a
+        time.monotonic() instant after which the call is useless.
+        """
+        started = time.monotonic()
+
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+
+        try:
+            await self._take_slot(priority, deadline)
+
+            try:
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+
+                if self.requests is not None:
+                    await self.requests.take(1)
+                if self.tokens is not None and estimated_tokens:
+                    await self.tokens.take(estimated_tokens)
+
+            except BaseException:
+                self._free_slot()
+                raise
+
+        finally:
+            self.waiting -= 1
+
+        self.admitted += 1
+        self.wait_time += time.monotonic() - started
+
+    async def _take_slot(self, priority: Priority, deadline: Optional[float]):
+        if self.active < int(self.window) and not self.queue:
+            self.active += 1
+            return
+
+        remaining = deadline - time.monotonic() if deadline is not None else None
+        timeout = self.queue.wait_limit(priority, remaining)
+
+        # _wake() counts the slot as ours before resolving
+        future = self.queue.push(priority)
+
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            if not self.queue.abandon(priority, future, stale=True):
+                self._free_slot()
+            raise LLMShed(priority, "stale in queue") from None
+        except BaseException:
+            if not self.queue.abandon(priority, future, stale=False):
+                self._free_slot()
+            raise
+
+    def _wake(self):
+        while self.active < int(self.window):
+            future = self.queue.pop()
+            if future is None:
+                return
+            self.active += 1
+            future.set_result(None)
+
+    def _free_slot(self):
+        self.active -= 1
+        self._wake()
+
+    def release(
+        self,
+        success: bool = True,
+        throttled: bool = False,
+        retry_after: Optional[float] = None
+    ):
+        if throttled:
+            self.throttled += 1
+            now = time.monotonic()
+
+            if now - self._last_decrease >= DECREASE_COOLDOWN:
+                self.window = max(self.minimum, self.window / 2)
+                self._last_decrease = now
+
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+        elif success:
+            self.window = min(self.maximum, self.window + 1 / self.window)
+
+        self._free_slot()
+
+    def used_tokens(self, estimated: float, actual: Optional[float]):
+        """Settle the token bucket once the real usage is known"""
+        if self.tokens is not None and actual is not None:
+            self.tokens.adjust(actual - estimated)
+
+    def stats(self) -> dict:
+        return {
+            "window": round(self.window, 2),
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_waiting,
+            "admitted": self.admitted,
+            "throttled": self.throttled,
+            "avg_wait_ms": round(self.wait_time / self.admitted * 1000, 2) if self.admitted else 0.0,
+            "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 2),
+            "rpm_available": round(self.requests.tokens) if self.requests else None,
+            "tpm_available": round(self.tokens.tokens) if self.tokens else None,
+            **self.queue.stats(),
+        }
@@ -0,0 +1,164 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import asyncio
+import threading
+from typing import Optional
+
+from services.ttl_cache import TTLCache
+
+
+# ---------------- CONFIG ----------------
+CACHE_MODES = {
+    m.strip().upper()
+    for m in os.getenv("LLM_CACHE_MODES", "RAG").split(",")
+    if m.strip()
+}
+CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1024"))
+CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(60 * 60 * 24)))
+CACHE_DB = os.getenv("LLM_CACHE_DB", "")  # empty → memory tier only
+CACHE_DB_MAX_ROWS = int(os.getenv("LLM_CACHE_DB_MAX_ROWS", "50000"))
+
+_SPACE_RE = re.compile(r"\s+")
+
+
+def prompt_key(model: str, prompt: str) -> str:
+    """Hash of model + whitespace-normalized prompt"""
+    normalized = _SPACE_RE.sub(" ", prompt).strip()
+    return hashlib.sha256(f"{model}\0{normalized}".encode("utf-8")).hexdigest()
+
+
+# =====================================================
+# SQLITE TIER
+# =====================================================
+class _SQLiteTier:
+    PRUNE_EVERY = 100
+
+    def __init__(self, path: str, ttl: float, max_rows: int):
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self._writes = 0
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                mode TEXT,
+                response TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                last_hit REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_hit "
+            "ON responses (last_hit)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM responses "
+                "WHERE key = ? AND expires_at > ?",
+                (key, now),
+            ).fetchone()
+
+            if row:
+                self._conn.execute(
+                    "UPDATE responses SET last_hit = ? WHERE key = ?",
+                    (now, key),
+                )
+                self._conn.commit()
+
+        return row[0] if row else None
+
+    def set(self, key: str, mode: str, response: str):
+        now = time.time()
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses "
+                "(key, mode, response, expires_at, last_hit) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, mode, response, now + self.ttl, now),
+            )
+
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                self._prune(now)
+
+            self._conn.commit()
+
+    def _prune(self, now: float):
+        """Drop expired rows, then least recently hit beyond max_rows"""
+        self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        self._conn.execute(
+            "DELETE FROM responses WHERE key IN ("
+            "  SELECT key FROM responses ORDER BY last_hit DESC"
+            "  LIMIT -1 OFFSET ?"
+            ")",
+            (self.max_rows,),
+        )
+
+
+# =====================================================
+# RESPONSE CACHE
+# =====================================================
+class ResponseCache:
+    """
+    Two-tier cache for LLM responses: an in-memory LRU in front
+    of an optional SQLite file shared across restarts and workers.
+    Only prompt modes listed in `modes` are cached.
+    """
+
+    def __init__(
+        self,
+        modes=None,
+        maxsize: int = CACHE_SIZE,
+        ttl: float = CACHE_TTL,
+        db_path: str = CACHE_DB,
+        db_max_rows: int = CACHE_DB_MAX_ROWS,
+    ):
+        self.modes = set(CACHE_MODES if modes is None else modes)
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.disk = _SQLiteTier(db_path, ttl, db_max_rows) if db_path else None
+
+        self.disk_hits = 0
+
+    def enabled_for(self, mode: str) -> bool:
+        return mode.upper() in self.modes
+
+    async def get(self, model: str, prompt: str) -> Optional[str]:
+        key = prompt_key(model, prompt)
+
+        response = self.memory.get(key)
+        if response is not None or self.disk is None:
+            return response
+
+        response = await asyncio.to_thread(self.disk.get, key)
+        if response is not None:
+            self.disk_hits += 1
+            self.memory.set(key, response)
+
+        return response
+
+    async def set(self, model: str, prompt: str, mode: str, response: str):
+        key = prompt_key(model, prompt)
+        self.memory.set(key, response)
+
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, mode, response)
+
+    def stats(self) -> dict:
+        return {
+            "modes": sorted(self.modes),
+            "memory": self.memory.stats(),
+            "disk_enabled": self.disk is not None,
+            "disk_hits": self.disk_hits,
+        }
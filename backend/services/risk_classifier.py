@@ -1,34 +1,78 @@
 import re
+from typing import Dict, List, Optional, Tuple
+
+
+# fever lasting N days (> FEVER_DAYS_LIMIT → MEDIUM)
+_FEVER_DAYS_RE = re.compile(r"(?<!\d)(\d+)\s*days?")
+FEVER_DAYS_LIMIT = 3
+
+
+def trie_pattern(phrases: List[str]) -> str:
+    """
+    Regex alternation for literal phrases, factored into a trie.
+
+    "cough blood" / "coughing blood" → "cough(?:\\ blood|ing\\ blood)"
+    At each offset the engine follows one branch per character
+    instead of trying every phrase, so the cost barely grows with
+    the number of phrases.
+    """
+
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for ch in phrase:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [
+            re.escape(ch) + build(child)
+            for ch, child in sorted(node.items())
+            if ch
+        ]
+        if not branches:
+            return ""
+
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        if "" in node:
+            body = f"(?:{body})?"
+        return body
+
+    return build(trie)
 
 
 class RiskClassifier:
     def __init__(self):
 
         # =====================================================
-        # HIGH RISK PATTERNS (regex based)
+        # HIGH RISK PHRASES (whole words)
         # =====================================================
-        self.high_risk_patterns = [
-            r"\bchest pain\b",
-            r"\b(shortness of breath|difficulty breathing|can't breathe)\b",
-            r"\bloss of consciousness\b",
-            r"\bfainted?\b",
-            r"\bstroke\b",
-            r"\bface drooping\b",
-            r"\barm weakness\b",
-            r"\bsevere bleeding\b",
-            r"\buncontrolled bleeding\b",
-            r"\bheart attack\b",
-            r"\banaphylaxis\b",
-            r"\bchoking\b",
-            r"\bseizure\b",
-            r"\bsuicidal?\b",
-            r"\bwant to die\b",
-            r"\bcough(ing)? blood\b",
-            r"\bvomit(ing)? blood\b",
-        ]
+        self.high_risk_phrases: Dict[str, List[str]] = {
+            "chest_pain": ["chest pain"],
+            "breathing": [
+                "shortness of breath",
+                "difficulty breathing",
+                "can't breathe",
+            ],
+            "unconscious": ["loss of consciousness"],
+            "fainting": ["fainted"],
+            "stroke": ["stroke"],
+            "face_drooping": ["face drooping"],
+            "arm_weakness": ["arm weakness"],
+            "severe_bleeding": ["severe bleeding"],
+            "uncontrolled_bleeding": ["uncontrolled bleeding"],
+            "heart_attack": ["heart attack"],
+            "anaphylaxis": ["anaphylaxis"],
+            "choking": ["choking"],
+            "seizure": ["seizure"],
+            "suicidal": ["suicidal"],
+            "want_to_die": ["want to die"],
+            "coughing_blood": ["cough blood", "coughing blood"],
+            "vomiting_blood": ["vomit blood", "vomiting blood"],
+        }
 
         # =====================================================
-        # MEDIUM RISK KEYWORDS
+        # MEDIUM RISK KEYWORDS (anywhere in the text)
         # =====================================================
         self.medium_risk_keywords = [
             "persistent",
@@ -38,32 +82,110 @@ class RiskClassifier:
             "high fever"
         ]
 
+        self.compile()
+
+    # =====================================================
+    # SINGLE-PASS MATCHER
+    # =====================================================
+    def compile(self):
+        """
+        Build the one regex that finds every rule phrase.
+        Call again after editing the phrase lists.
+        """
+
+        self._phrase_rules: Dict[str, Tuple[str, str]] = {}
+
+        for keyword in self.medium_risk_keywords:
+            self._phrase_rules[keyword] = ("MEDIUM", keyword)
+
+        # HIGH wins if a phrase is listed at both levels
+        for name, phrases in self.high_risk_phrases.items():
+            for phrase in phrases:
+                self._phrase_rules[phrase] = ("HIGH", name)
+
+        high = [
+            phrase
+            for phrases in self.high_risk_phrases.values()
+            for phrase in phrases
+        ]
+
+        self._matcher = re.compile(
+            rf"\b(?:{trie_pattern(high)})\b"
+            rf"|(?:{trie_pattern(self.medium_risk_keywords)})"
+        )
+
+    @staticmethod
+    def _fever_days(text: str) -> Optional[int]:
+        """
+        Days from the first "<fever> ... N day(s)" on any line.
+
+        Each line is scanned once from its first "fever", so the
+        cost stays linear however many times "fever" repeats.
+        """
+
+        pos = text.find("fever")
+
+        while pos != -1:
+            line_end = text.find("\n", pos)
+            if line_end == -1:
+                line_end = len(text)
+
+            match = _FEVER_DAYS_RE.search(text, pos + 5, line_end)
+            if match:
+                return int(match.group(1))
+
+            pos = text.find("fever", line_end)
+
+        return None
+
     # =====================================================
     # CLASSIFY RISK
     # =====================================================
-    def classify_risk(self, text: str) -> str:
+    def classify_with_rule(self, text: str) -> Tuple[str, Optional[str]]:
+        """
+        (risk level, name of the rule that decided it).
+        The rule is None for LOW.
+        """
+
         text_lower = text.lower()
+        medium_rule = None
+
+        # ---------- HIGH RISK + MEDIUM KEYWORDS (one scan) ----------
+        pos = 0
+        while True:
+            match = self._matcher.search(text_lower, pos)
+            if match is None:
+                break
+
+            level, name = self._phrase_rules[match.group()]
+            if level == "HIGH":
+                return "HIGH", name
+
+            if medium_rule is None:
+                medium_rule = name
 
-        # ---------- HIGH RISK CHECK ----------
-        for pattern in self.high_risk_patterns:
-            if re.search(pattern, text_lower):
-                return "HIGH"
+            # resume inside the match: a HIGH phrase may overlap it
+            pos = match.start() + 1
 
         # ---------- MEDIUM RISK CHECK ----------
 
         # Fever duration detection
-        fever_match = re.search(r"fever.*?(\d+)\s*days?", text_lower)
-        if fever_match:
-            days = int(fever_match.group(1))
-            if days > 3:
-                return "MEDIUM"
+        days = self._fever_days(text_lower)
+        if days is not None and days > FEVER_DAYS_LIMIT:
+            return "MEDIUM", "fever_duration"
 
         # Generic medium risk language
-        for keyword in self.medium_risk_keywords:
-            if keyword in text_lower:
-                return "MEDIUM"
+        if medium_rule is not None:
+            return "MEDIUM", medium_rule
+
+        return "LOW", None
+
+    def classify_risk(self, text: str) -> str:
+        return self.classify_with_rule(text)[0]
 
-        return "LOW"
+    def classify_many(self, texts: List[str]) -> List[str]:
+        """Risk level for each text, in order"""
+        return [self.classify_with_rule(text)[0] for text in texts]
 
     # =====================================================
     # EMERGENCY RESPONSE
@@ -77,4 +199,4 @@ It sounds like you may be experiencing a medical emergency.
 
 Do not wait for online advice.
 
-Your safety is the top priority."""
\ No newline at end of file
+Your safety is the top priority."""
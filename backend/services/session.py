@@ -0,0 +1,115 @@
+import time
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import List, Optional, Tuple
+
+
+# keep history bounded (avoid token explosion)
+HISTORY_LIMIT = 20
+
+
+class Role(str, Enum):
+    USER = "user"
+    MODEL = "model"
+
+
+class DiagnosticState(str, Enum):
+    INITIAL = "INITIAL"
+    GATHERING = "GATHERING"
+    CLARIFYING = "CLARIFYING"
+    FINAL = "FINAL"
+
+
+class SessionStatus(str, Enum):
+    ACTIVE = "ACTIVE"
+    ENDED = "ENDED"
+    EMERGENCY_LOCKED = "EMERGENCY_LOCKED"
+
+
+_ROLES = {role.value: role for role in Role}
+
+
+# =====================================================
+# SESSION
+# =====================================================
+@dataclass(slots=True, eq=False)
+class Session:
+    """
+    One conversation.
+
+    History entries are (Role, text) tuples instead of
+    {"role", "parts": [text]} dicts, about a fifth of the size.
+
+    Plain lists rather than deques: an empty deque already
+    takes ~760 bytes, more than the dict-based session saved,
+    and at HISTORY_LIMIT entries dropping the oldest is a
+    20-pointer memmove. Pending questions are kept in reverse
+    so the next one comes off the end with an O(1) pop().
+    """
+
+    history: List[Tuple[Role, str]] = field(default_factory=list)
+    created_at: float = field(default_factory=time.time)
+    last_accessed: float = field(default_factory=time.time)
+
+    # conversational diagnosis state
+    pending_questions: List[str] = field(default_factory=list)  # reversed
+    collected_answers: List[str] = field(default_factory=list)
+    candidate_diseases: List[str] = field(default_factory=list)
+    diagnostic_state: DiagnosticState = DiagnosticState.INITIAL
+
+    # session state
+    status: SessionStatus = SessionStatus.ACTIVE
+
+    # ---------------- history ----------------
+    def add_message(self, role: str, message: str):
+        self.history.append((_ROLES[role], message))
+
+        if len(self.history) > HISTORY_LIMIT:
+            del self.history[0]
+
+    def history_dicts(self) -> List[dict]:
+        """History in the {"role", "parts"} shape the prompts use"""
+        return [
+            {"role": role.value, "parts": [text]}
+            for role, text in self.history
+        ]
+
+    # ---------------- pending questions ----------------
+    def set_pending(self, questions: List[str]):
+        self.pending_questions = list(reversed(questions))
+
+    def pop_pending(self) -> Optional[str]:
+        if not self.pending_questions:
+            return None
+        return self.pending_questions.pop()
+
+    # ---------------- serialization (SQLite store) ----------------
+    def to_dict(self) -> dict:
+        return {
+            "history": [[role.value, text] for role, text in self.history],
+            "created_at": self.created_at,
+            "last_accessed": self.last_accessed,
+            "pending_questions": self.pending_questions[::-1],
+            "collected_answers": self.collected_answers,
+            "candidate_diseases": self.candidate_diseases,
+            "diagnostic_state": self.diagnostic_state.value,
+            "status": self.status.value,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Session":
+        session = cls(
+            created_at=data["created_at"],
+            last_accessed=data["last_accessed"],
+            collected_answers=list(data.get("collected_answers", [])),
+            candidate_diseases=list(data.get("candidate_diseases", [])),
+            diagnostic_state=DiagnosticState(data.get("diagnostic_state", "INITIAL")),
+            status=SessionStatus(data.get("status", "ACTIVE")),
+        )
+
+        session.history.extend(
+            (_ROLES[role], text) for role, text in data.get("history", [])
+        )
+        session.set_pending(data.get("pending_questions", []))
+
+        return session
@@ -1,15 +1,201 @@
+import os
 import uuid
 import time
-from typing import Dict, List, Optional
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+from services.session import DiagnosticState, Session, SessionStatus
+from services.session_store import InMemorySessionStore, SessionStore
+
+# how long a turn waits for another worker's lease on its session
+# before failing with SessionBusy
+LEASE_WAIT_TIMEOUT = 10.0
+LEASE_POLL_INTERVAL = 0.02
+
+# a held lease is renewed this often, as a share of the store's TTL
+LEASE_RENEW_SHARE = 1 / 3
+
+# idle sessions expire after SESSION_TIMEOUT seconds; the
+# background sweeper checks every SESSION_SWEEP_INTERVAL
+SESSION_TIMEOUT = float(os.getenv("SESSION_TIMEOUT", str(60 * 30)))
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "30"))
+SWEEP_BATCH = 1000
+
+
+class SessionBusy(Exception):
+    """Another turn still holds the session's lease"""
 
 
 class SessionManager:
-    def __init__(self):
+    def __init__(self, store: Optional[SessionStore] = None):
         # session_id → session data
-        self._sessions: Dict[str, dict] = {}
+        self._store = store if store is not None else InMemorySessionStore()
+
+        # the chat turn scope active in this task (see open_scope), if any
+        self._scope: ContextVar[Optional[dict]] = ContextVar(
+            "session_scope", default=None
+        )
 
         # auto cleanup timeout (30 minutes)
-        self.session_timeout = 60 * 30
+        self.session_timeout = SESSION_TIMEOUT
+
+        self._sweeper: Optional[asyncio.Task] = None
+
+        # metrics
+        self.lease_timeouts = 0
+        self.leases_lost = 0
+
+        self.last_sweep = {"at": None, "expired": 0, "evicted": 0, "ms": 0.0}
+
+    # =====================================================
+    # STORE ACCESS
+    # =====================================================
+
+    async def _io(self, fn, *args):
+        """Store call, off the event loop when the store blocks on disk"""
+        if self._store.blocking:
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    def _load(self, session_id: str) -> Optional[Session]:
+        scope = self._scope.get()
+
+        if scope is not None and session_id in scope["deleted"]:
+            return None
+
+        if scope is not None and session_id in scope["sessions"]:
+            return scope["sessions"][session_id]
+
+        session = self._store.get(session_id)
+
+        if scope is not None and session is not None:
+            scope["sessions"][session_id] = session
+
+        return session
+
+    def _save(self, session_id: str, session: Session):
+        """Write through, or defer to the end of the open scope"""
+        scope = self._scope.get()
+
+        if scope is not None and session_id in scope["sessions"]:
+            scope["dirty"].add(session_id)
+        else:
+            self._store.put(session_id, session)
+
+    async def open_scope(self, session_id: Optional[str]) -> dict:
+        """
+        Start one chat turn on `session_id`.
+
+        Takes the session's lease (so two workers never interleave
+        turns on it; SessionBusy if it stays taken), loads it once
+        and marks it accessed. The lease is renewed until the scope
+        closes. A missing or ended session is replaced by a new one;
+        scope["session_id"] is the session the turn runs on.
+
+        Reads and writes go through the scope while in_scope() is
+        active; close_scope() writes them back in one batch and
+        frees the lease.
+        """
+
+        scope = {
+            "session_id": session_id,
+            "owner": uuid.uuid4().hex,
+            "leased": False,
+            "lease_lost": False,
+            "renewer": None,
+            "sessions": {},
+            "dirty": set(),
+            "deleted": set(),
+        }
+
+        if session_id:
+            await self._acquire_lease(session_id, scope["owner"])
+            scope["leased"] = True
+
+            try:
+                session = await self._io(self._store.get, session_id)
+            except BaseException:
+                await self._io(self._store.release_lease, session_id, scope["owner"])
+                raise
+
+            if session is not None and session.status is not SessionStatus.ENDED:
+                session.last_accessed = time.time()
+                scope["sessions"][session_id] = session
+                scope["dirty"].add(session_id)
+
+                if self._store.lease_ttl:
+                    scope["renewer"] = asyncio.create_task(self._renew_lease(scope))
+                return scope
+
+            if scope["leased"]:
+                await self._io(self._store.release_lease, session_id, scope["owner"])
+                scope["leased"] = False
+
+        # nobody else knows a fresh id, so it needs no lease
+        session_id = scope["session_id"] = str(uuid.uuid4())
+        scope["sessions"][session_id] = Session()
+        scope["dirty"].add(session_id)
+
+        return scope
+
+    @contextmanager
+    def in_scope(self, scope: dict):
+        """Serve reads and defer writes through `scope` in this task"""
+        token = self._scope.set(scope)
+        try:
+            yield
+        finally:
+            self._scope.reset(token)
+
+    async def close_scope(self, scope: dict):
+        """Write the turn's changes back and free its lease"""
+        if scope["renewer"] is not None:
+            scope["renewer"].cancel()
+
+        # another turn may own the session now: don't overwrite it
+        if scope["lease_lost"]:
+            return
+
+        try:
+            for session_id in scope["deleted"]:
+                await self._io(self._store.delete, session_id)
+
+            await self._io(self._store.put_many, [
+                (sid, scope["sessions"][sid]) for sid in scope["dirty"]
+            ])
+
+        finally:
+            if scope["leased"]:
+                await self._io(
+                    self._store.release_lease, scope["session_id"], scope["owner"]
+                )
+
+    async def _acquire_lease(self, session_id: str, owner: str):
+        deadline = time.monotonic() + LEASE_WAIT_TIMEOUT
+
+        while not await self._io(self._store.acquire_lease, session_id, owner):
+            if time.monotonic() >= deadline:
+                self.lease_timeouts += 1
+                raise SessionBusy(f"session {session_id} is busy")
+
+            await asyncio.sleep(LEASE_POLL_INTERVAL)
+
+    async def _renew_lease(self, scope: dict):
+        """Keep the lease alive for turns longer than its TTL"""
+        interval = self._store.lease_ttl * LEASE_RENEW_SHARE
+
+        while True:
+            await asyncio.sleep(interval)
+
+            renewed = await self._io(
+                self._store.renew_lease, scope["session_id"], scope["owner"]
+            )
+            if not renewed:
+                self.leases_lost += 1
+                scope["lease_lost"] = True
+                return
 
     # =====================================================
     # SESSION LIFECYCLE
@@ -19,63 +205,111 @@ class SessionManager:
         """Create a new session"""
         session_id = str(uuid.uuid4())
 
-        self._sessions[session_id] = {
-            "history": [],
-            "created_at": time.time(),
-            "last_accessed": time.time(),
-
-            # conversational diagnosis state
-            "pending_questions": [],
-            "collected_answers": [],
-            "candidate_diseases": [],
-            "diagnostic_state": "INITIAL",  # INITIAL | GATHERING | CLARIFYING | FINAL
-
-            # session state
-            "status": "ACTIVE"  # ACTIVE | ENDED | EMERGENCY_LOCKED
-        }
+        self._store.put(session_id, Session())
 
         return session_id
 
     def end_session(self, session_id: str):
-        """End and delete a session"""
-        if session_id in self._sessions:
-            del self._sessions[session_id]
+        """End and delete a session (when the open scope closes)"""
+        scope = self._scope.get()
+
+        if scope is None:
+            self._store.delete(session_id)
+            return
+
+        scope["sessions"].pop(session_id, None)
+        scope["dirty"].discard(session_id)
+        scope["deleted"].add(session_id)
 
     def reset_all_sessions(self):
         """Hard reset like restarting server"""
-        self._sessions.clear()
+        self._store.clear()
 
     def lock_emergency(self, session_id: str):
         """Lock session after emergency detection"""
-        if session_id in self._sessions:
-            self._sessions[session_id]["status"] = "EMERGENCY_LOCKED"
+        session = self._load(session_id)
+        if session:
+            session.status = SessionStatus.EMERGENCY_LOCKED
+            self._save(session_id, session)
 
     # =====================================================
     # CLEANUP
     # =====================================================
 
-    def cleanup_expired_sessions(self):
-        """Remove inactive sessions"""
-        now = time.time()
-
-        expired = [
-            sid for sid, sess in self._sessions.items()
-            if now - sess["last_accessed"] > self.session_timeout
-        ]
+    async def cleanup_expired_sessions(self, limit: int = SWEEP_BATCH) -> int:
+        """Remove up to `limit` inactive sessions, oldest first"""
+        return await self._io(self._store.delete_expired, self.session_timeout, limit)
+
+    async def sweep(self):
+        """
+        Expire idle sessions in batches, yielding to the event
+        loop between batches, then enforce the session cap.
+        """
+        started = time.perf_counter()
+        expired = 0
+
+        while True:
+            batch = await self.cleanup_expired_sessions(SWEEP_BATCH)
+            expired += batch
+            if batch < SWEEP_BATCH:
+                break
+            await asyncio.sleep(0)
+
+        evicted = await self._io(self._store.evict_excess)
+
+        self.last_sweep = {
+            "at": time.time(),
+            "expired": expired,
+            "evicted": evicted,
+            "ms": round((time.perf_counter() - started) * 1000, 2),
+        }
 
-        for sid in expired:
-            del self._sessions[sid]
+    async def _sweep_forever(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"Session sweep failed: {e}")
+
+    def start_sweeper(self, interval: float = SESSION_SWEEP_INTERVAL):
+        """Run sweep() every `interval` seconds on the current loop"""
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep_forever(interval))
+
+    async def stop_sweeper(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+    def session_count(self) -> int:
+        return len(self._store)
+
+    def stats(self) -> dict:
+        return {
+            **self._store.stats(),
+            "timeout": self.session_timeout,
+            "sweeper_running": self._sweeper is not None and not self._sweeper.done(),
+            "lease_timeouts": self.lease_timeouts,
+            "leases_lost": self.leases_lost,
+            "last_sweep": self.last_sweep,
+        }
 
     # =====================================================
     # SESSION ACCESS
     # =====================================================
 
-    def get_session(self, session_id: str) -> Optional[dict]:
+    def get_session(self, session_id: str) -> Optional[Session]:
         """Retrieve session if active"""
-        session = self._sessions.get(session_id)
+        session = self._load(session_id)
 
-        if session and session["status"] in ["ACTIVE", "EMERGENCY_LOCKED"]:
-            session["last_accessed"] = time.time()
+        if session and session.status is not SessionStatus.ENDED:
+            session.last_accessed = time.time()
+            self._save(session_id, session)
             return session
 
         return None
@@ -86,22 +320,16 @@ class SessionManager:
 
     def add_message(self, session_id: str, role: str, message: str):
         """Add message to chat history"""
-        if session_id in self._sessions:
-            history = self._sessions[session_id]["history"]
-
-            history.append({
-                "role": role,
-                "parts": [message]
-            })
-
-            # keep history bounded (avoid token explosion)
-            if len(history) > 20:
-                history.pop(0)
+        session = self._load(session_id)
+        if session:
+            session.add_message(role, message)
+            self._save(session_id, session)
 
     def get_history(self, session_id: str) -> List[dict]:
         """Get conversation history"""
-        if session_id in self._sessions:
-            return self._sessions[session_id]["history"]
+        session = self._load(session_id)
+        if session:
+            return session.history_dicts()
         return []
 
     # =====================================================
@@ -110,56 +338,68 @@ class SessionManager:
 
     def set_followups(self, session_id: str, questions: List[str]):
         """Store follow-up questions"""
-        if session_id in self._sessions:
-            self._sessions[session_id]["pending_questions"] = list(questions)
-            self._sessions[session_id]["collected_answers"] = []
+        session = self._load(session_id)
+        if session:
+            session.set_pending(questions)
+            session.collected_answers = []
+            self._save(session_id, session)
 
     def get_next_question(self, session_id: str) -> Optional[str]:
         """Return next follow-up question"""
-        if session_id in self._sessions:
-            pending = self._sessions[session_id]["pending_questions"]
-            if pending:
-                return pending.pop(0)
+        session = self._load(session_id)
+        if session:
+            question = session.pop_pending()
+            if question is not None:
+                self._save(session_id, session)
+                return question
         return None
 
     def add_answer(self, session_id: str, answer: str):
         """Store user's follow-up answer"""
-        if session_id in self._sessions:
-            self._sessions[session_id]["collected_answers"].append(answer)
+        session = self._load(session_id)
+        if session:
+            session.collected_answers.append(answer)
+            self._save(session_id, session)
 
     def has_pending_questions(self, session_id: str) -> bool:
         """Check if follow-up questions remain"""
-        if session_id in self._sessions:
-            return len(self._sessions[session_id]["pending_questions"]) > 0
+        session = self._load(session_id)
+        if session:
+            return bool(session.pending_questions)
         return False
 
     def clear_followups(self, session_id: str):
         """Stop questioning flow"""
-        if session_id in self._sessions:
-            self._sessions[session_id]["pending_questions"] = []
-            self._sessions[session_id]["collected_answers"] = []
+        session = self._load(session_id)
+        if session:
+            session.set_pending([])
+            session.collected_answers = []
+            self._save(session_id, session)
 
     # =====================================================
     # DIAGNOSTIC STATE MANAGEMENT
     # =====================================================
 
     def set_candidate_diseases(self, session_id: str, diseases: List[str]):
-        if session_id in self._sessions:
-            self._sessions[session_id]["candidate_diseases"] = diseases
+        session = self._load(session_id)
+        if session:
+            session.candidate_diseases = list(diseases)
+            self._save(session_id, session)
 
     def get_candidate_diseases(self, session_id: str) -> List[str]:
-        if session_id in self._sessions:
-            return self._sessions[session_id].get("candidate_diseases", [])
+        session = self._load(session_id)
+        if session:
+            return session.candidate_diseases
         return []
 
     def set_diagnostic_state(self, session_id: str, state: str):
-        if session_id in self._sessions:
-            self._sessions[session_id]["diagnostic_state"] = state
+        session = self._load(session_id)
+        if session:
+            session.diagnostic_state = DiagnosticState(state)
+            self._save(session_id, session)
 
     def get_diagnostic_state(self, session_id: str) -> str:
-        if session_id in self._sessions:
-            return self._sessions[session_id].get(
-                "diagnostic_state",
-                "INITIAL"
-            )
-        return "INITIAL"
\ No newline at end of file
+        session = self._load(session_id)
+        if session:
+            return session.diagnostic_state.value
+        return "INITIAL"
@@ -0,0 +1,350 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Iterable, Optional, Tuple
+
+from services.session import Session
+
+
+# ---------------- CONFIG ----------------
+# "memory" → per-process dict (single worker, lost on restart)
+# "sqlite" → shared WAL-mode file, safe across uvicorn workers
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+SESSION_DB = os.getenv("SESSION_DB", "sessions.db")
+
+# a crashed worker's session lease frees itself after this long
+SESSION_LEASE_TTL = float(os.getenv("SESSION_LEASE_TTL", "60"))
+
+# least recently used sessions are evicted past this many
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "100000"))
+
+
+# =====================================================
+# STORE INTERFACE
+# =====================================================
+class SessionStore(ABC):
+    """
+    Where SessionManager keeps Session objects.
+
+    get() returns the Session or None; changes made to it
+    only count once they are written back with put()/put_many().
+    Leases serialize turns on one session across workers.
+
+    `blocking` stores do disk I/O, so SessionManager calls them
+    from a worker thread instead of the event loop.
+    """
+
+    blocking = False
+
+    # seconds a lease lasts unless renewed; None → leases never expire
+    lease_ttl: Optional[float] = None
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[Session]:
+        ...
+
+    def put(self, session_id: str, session: Session):
+        self.put_many([(session_id, session)])
+
+    @abstractmethod
+    def put_many(self, items: Iterable[Tuple[str, Session]]):
+        ...
+
+    @abstractmethod
+    def delete(self, session_id: str):
+        ...
+
+    @abstractmethod
+    def clear(self):
+        ...
+
+    @abstractmethod
+    def delete_expired(self, timeout: float, limit: int = 1000) -> int:
+        """
+        Drop up to `limit` sessions idle for longer than
+        `timeout` seconds, oldest first. Returns how many.
+        """
+
+    def evict_excess(self) -> int:
+        """Drop least recently used sessions beyond max_sessions"""
+        return 0
+
+    @abstractmethod
+    def __len__(self):
+        ...
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self),
+            "max_sessions": self.max_sessions,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+    # ---------------- per-session lease ----------------
+    def acquire_lease(self, session_id: str, owner: str) -> bool:
+        return True
+
+    def renew_lease(self, session_id: str, owner: str) -> bool:
+        """Extend a held lease; False if `owner` no longer holds it"""
+        return True
+
+    def release_lease(self, session_id: str, owner: str):
+        pass
+
+
+# =====================================================
+# IN-MEMORY STORE (default)
+# =====================================================
+class InMemorySessionStore(SessionStore):
+    """
+    Access-ordered dict. get() hands out the live Session,
+    so writes are visible immediately and put() costs nothing.
+
+    Every get/put moves the session to the back, so the front
+    always holds the least recently used ones: expiry stops at
+    the first live session, and the session cap evicts from the
+    front in O(1).
+    """
+
+    def __init__(self, max_sessions: int = SESSION_MAX_SESSIONS):
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.max_sessions = max_sessions
+
+        self.expired = 0
+        self.evicted = 0
+
+    def get(self, session_id: str) -> Optional[Session]:
+        session = self._sessions.get(session_id)
+        if session is not None:
+            self._sessions.move_to_end(session_id)
+        return session
+
+    def put_many(self, items: Iterable[Tuple[str, Session]]):
+        for session_id, session in items:
+            self._sessions[session_id] = session
+            self._sessions.move_to_end(session_id)
+
+        self.evict_excess()
+
+    def delete(self, session_id: str):
+        self._sessions.pop(session_id, None)
+
+    def clear(self):
+        self._sessions.clear()
+
+    def delete_expired(self, timeout: float, limit: int = 1000) -> int:
+        cutoff = time.time() - timeout
+        deleted = 0
+
+        while self._sessions and deleted < limit:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.last_accessed >= cutoff:
+                break
+
+            del self._sessions[session_id]
+            deleted += 1
+
+        self.expired += deleted
+        return deleted
+
+    def evict_excess(self) -> int:
+        evicted = 0
+
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            evicted += 1
+
+        self.evicted += evicted
+        return evicted
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+# =====================================================
+# SQLITE STORE
+# =====================================================
+class SQLiteSessionStore(SessionStore):
+    """
+    Sessions as JSON rows in one WAL-mode SQLite file, shared by
+    every worker on the host and kept across restarts.
+
+    Leases are rows in a second table, taken with one atomic
+    upsert that only succeeds when the previous lease is gone
+    or expired.
+    """
+
+    blocking = True
+
+    def __init__(
+        self,
+        path: str = SESSION_DB,
+        lease_ttl: float = SESSION_LEASE_TTL,
+        max_sessions: int = SESSION_MAX_SESSIONS
+    ):
+        self.path = path
+        self.lease_ttl = lease_ttl
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+
+        # counted by this worker only
+        self.expired = 0
+        self.evicted = 0
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                last_accessed REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS sessions_last_accessed "
+            "ON sessions (last_accessed)"
+        )
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS session_leases (
+                session_id TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def get(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM sessions WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+
+        return Session.from_dict(json.loads(row[0])) if row else None
+
+    def put_many(self, items: Iterable[Tuple[str, Session]]):
+        """All rows in one transaction"""
+        rows = [
+            (sid, json.dumps(sess.to_dict(), ensure_ascii=False), sess.last_accessed)
+            for sid, sess in items
+        ]
+        if not rows:
+            return
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO sessions "
+                "(session_id, data, last_accessed) VALUES (?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM sessions WHERE session_id = ?", (session_id,)
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions")
+            self._conn.execute("DELETE FROM session_leases")
+            self._conn.commit()
+
+    def delete_expired(self, timeout: float, limit: int = 1000) -> int:
+        # index range scan: touches only the expired rows
+        cutoff = time.time() - timeout
+
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM sessions WHERE session_id IN ("
+                "  SELECT session_id FROM sessions WHERE last_accessed < ?"
+                "  ORDER BY last_accessed LIMIT ?"
+                ")",
+                (cutoff, limit),
+            ).rowcount
+            self._conn.execute(
+                "DELETE FROM session_leases WHERE expires_at < ?", (time.time(),)
+            )
+            self._conn.commit()
+
+        self.expired += deleted
+        return deleted
+
+    def evict_excess(self) -> int:
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            excess = count - self.max_sessions
+            if excess <= 0:
+                return 0
+
+            # oldest first via the last_accessed index
+            evicted = self._conn.execute(
+                "DELETE FROM sessions WHERE session_id IN ("
+                "  SELECT session_id FROM sessions"
+                "  ORDER BY last_accessed LIMIT ?"
+                ")",
+                (excess,),
+            ).rowcount
+            self._conn.commit()
+
+        self.evicted += evicted
+        return evicted
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    # ---------------- per-session lease ----------------
+    def acquire_lease(self, session_id: str, owner: str) -> bool:
+        now = time.time()
+
+        with self._lock:
+            taken = self._conn.execute(
+                "INSERT INTO session_leases (session_id, owner, expires_at) "
+                "VALUES (?, ?, ?) "
+                "ON CONFLICT (session_id) DO UPDATE SET "
+                "  owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE session_leases.expires_at < ?",
+                (session_id, owner, now + self.lease_ttl, now),
+            ).rowcount
+            self._conn.commit()
+
+        return taken == 1
+
+    def renew_lease(self, session_id: str, owner: str) -> bool:
+        with self._lock:
+            renewed = self._conn.execute(
+                "UPDATE session_leases SET expires_at = ? "
+                "WHERE session_id = ? AND owner = ?",
+                (time.time() + self.lease_ttl, session_id, owner),
+            ).rowcount
+            self._conn.commit()
+
+        return renewed == 1
+
+    def release_lease(self, session_id: str, owner: str):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM session_leases WHERE session_id = ? AND owner = ?",
+                (session_id, owner),
+            )
+            self._conn.commit()
+
+
+def create_session_store(kind: str = SESSION_STORE) -> SessionStore:
+    if kind == "sqlite":
+        print(f"Sessions stored in SQLite at {SESSION_DB}")
+        return SQLiteSessionStore(SESSION_DB)
+
+    if kind != "memory":
+        raise ValueError(f"Unknown SESSION_STORE {kind!r}")
+
+    return InMemorySessionStore()
@@ -0,0 +1,51 @@
+import time
+from contextlib import contextmanager
+
+
+# =====================================================
+# PER-TURN STAGE TIMING
+# =====================================================
+class StageTimer:
+    """
+    Records how long each stage of a chat turn took.
+
+    Stages may overlap (speculative work runs alongside the
+    analyzer), so the total is wall time since creation, not
+    the sum of the stages.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def timed(self, name: str, fn):
+        """Wrap a sync callable so its runtime is recorded"""
+        def wrapper(*args, **kwargs):
+            with self.stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    def total(self) -> float:
+        return time.perf_counter() - self.start
+
+    def summary(self) -> str:
+        parts = [f"{k}={v * 1000:.0f}ms" for k, v in self.stages.items()]
+        parts.append(f"total={self.total() * 1000:.0f}ms")
+        return " ".join(parts)
+
+    def server_timing(self) -> str:
+        """Value for the Server-Timing response header"""
+        parts = [f"{k};dur={v * 1000:.1f}" for k, v in self.stages.items()]
+        parts.append(f"total;dur={self.total() * 1000:.1f}")
+        return ", ".join(parts)
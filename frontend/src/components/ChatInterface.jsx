@@ -1,6 +1,6 @@
 import React, { useState, useEffect, useRef } from 'react';
 import ReactMarkdown from 'react-markdown';
-import { sendMessage } from '../services/api';
+import { streamMessage } from '../services/api';
 import './ChatInterface.css';
 
 const ChatInterface = () => {
@@ -69,8 +69,25 @@ const ChatInterface = () => {
         setInput('');
         setIsLoading(true);
 
+        let started = false;
+
         try {
-            const data = await sendMessage(userMsg.content, sessionId);
+            const data = await streamMessage(userMsg.content, sessionId, {
+                // render the reply as it is generated
+                onToken: (_chunk, text) => {
+                    if (!started) {
+                        started = true;
+                        setIsLoading(false);
+                        setMessages(prev => [...prev, { role: 'bot', content: text }]);
+                        return;
+                    }
+
+                    setMessages(prev => [
+                        ...prev.slice(0, -1),
+                        { role: 'bot', content: text }
+                    ]);
+                }
+            });
 
             // update session id
             if (data.session_id && data.session_id !== sessionId) {
@@ -83,12 +100,10 @@ const ChatInterface = () => {
                 setIsLocked(true);
             }
 
-            const botMsg = {
-                role: 'bot',
-                content: data.response
-            };
-
-            setMessages(prev => [...prev, botMsg]);
+            // empty stream → still show a bubble
+            if (!started) {
+                setMessages(prev => [...prev, { role: 'bot', content: data.response }]);
+            }
 
         } catch (error) {
             const errorMsg = {
@@ -1,8 +1,10 @@
 import axios from 'axios';
 
+const BASE_URL = 'http://localhost:8000';
+
 // Create axios instance with base URL
 const api = axios.create({
-    baseURL: 'http://localhost:8000',
+    baseURL: BASE_URL,
     headers: {
         'Content-Type': 'application/json',
     },
@@ -20,3 +22,67 @@ export const sendMessage = async (message, sessionId) => {
         throw error;
     }
 };
+
+// Stream a reply from /chat/stream (Server-Sent Events).
+// onToken receives each text chunk as it arrives; resolves with
+// the same { response, session_id } shape as sendMessage.
+export const streamMessage = async (message, sessionId, { onSession, onToken } = {}) => {
+    const res = await fetch(`${BASE_URL}/chat/stream`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ message, session_id: sessionId }),
+    });
+
+    if (!res.ok || !res.body) {
+        throw new Error(`Stream failed: ${res.status}`);
+    }
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+
+    let buffer = '';
+    let text = '';
+    let session = sessionId;
+
+    const handleEvent = (raw) => {
+        let event = 'message';
+        let data = '';
+
+        for (const line of raw.split('\n')) {
+            if (line.startsWith('event:')) event = line.slice(6).trim();
+            else if (line.startsWith('data:')) data += line.slice(5).trim();
+        }
+        if (!data) return;
+
+        const payload = JSON.parse(data);
+
+        if (event === 'session') {
+            session = payload.session_id;
+            onSession?.(session);
+        } else if (event === 'token') {
+            text += payload.text;
+            onToken?.(payload.text, text);
+        }
+    };
+
+    try {
+        for (;;) {
+            const { done, value } = await reader.read();
+            if (done) break;
+
+            buffer += decoder.decode(value, { stream: true });
+
+            // events are separated by a blank line
+            let sep;
+            while ((sep = buffer.indexOf('\n\n')) !== -1) {
+                handleEvent(buffer.slice(0, sep));
+                buffer = buffer.slice(sep + 2);
+            }
+        }
+    } catch (error) {
+        console.error("Stream Error:", error);
+        throw error;
+    }
+
+    return { response: text, session_id: session };
+};